@@ -0,0 +1,731 @@
+#
+#  bench.py
+###########################################################################
+#
+#  Purpose:
+#
+#      Benchmark the preprocessor and the load on synthetic SSSOM files,
+#      without mgd or the real download directory
+#
+#  Usage:
+#
+#      bench.py [rows ...]
+#      bench.py --dedup [rows ...]
+#      bench.py --render [rows ...]
+#      bench.py --columnar [rows ...]
+#
+#      rows defaults to 10000 100000 1000000; for each size the files are
+#      generated once, then the preprocessor and the load each run in a
+#      process of their own, as preprocess.py and process.py do, so the
+#      peak memory of each is measured separately; then the load runs
+#      again with LOAD_ENGINE=copy and the rows it streams must be the
+#      rows of the bcp files
+#
+#      --dedup times MappingValidator.validateRecords(), the QC and the
+#      duplicate check of the preprocessor, on files with a high dupe rate
+#      (dedupDupeRate unless BENCH_DUPE_RATE is set) and on files of the
+#      same size without dupes
+#
+#      --render times the bcp rows of the same records rendered with the
+#      % formatting process.py used before RowRenderer, and with RowRenderer
+#
+#      --columnar times parseInputFiles() of the preprocessor with
+#      VALIDATION_ENGINE=row and with VALIDATION_ENGINE=columnar on the
+#      same files; both must write the same intermediate file and
+#      curation logs, byte for byte
+#
+#  Env Vars:
+#
+#	PARSE_WORKERS - passed through to the preprocessor, default 1
+#	LOOKUP_MODE, VALIDATION_ENGINE - passed through to the preprocessor
+#	BENCH_KEEP - if 'true' the generated files and outputs are kept
+#	BENCH_DUPE_RATE, BENCH_INVALID_RATE, BENCH_NONPREFERRED_RATE,
+#	    BENCH_LABEL_RATE - the rates of the generated files (see
+#	    gensssom.py), unset keeps the generator's default
+#
+#  Outputs:
+#
+#      For each size and stage: seconds, rows per second and the peak
+#      resident memory of the stage's process by the end of the stage;
+#      then for each size the peak resident memory of the preprocessor,
+#      of the load and of the copy engine load
+#
+#      --dedup: for each size the dupes found, seconds and nanoseconds per
+#      row, and nanoseconds per row of the files without dupes; a flat time
+#      per row is a linear cost
+#
+#      --render: for each size and renderer the seconds and records per
+#      second; both must render the same rows
+#
+#      --columnar: for each size and engine the seconds, rows per second
+#      and the records that passed QC; the engines must write the same
+#      files
+#
+#  Notes:
+#
+#      Stages, in the preprocessor's process:
+#	initialize	- preprocess.initialize(), the MP/HP lookups
+#	parseInputFiles	- parse, QC and dedupe the input files, write the
+#			  intermediate file and the curation log
+#      in the load's process:
+#	reserveKeys	- process.initialize() and process.reserveKeys()
+#	process		- read the intermediate file, render and write the
+#			  bcp files
+#	render		- process.processRecord() alone on the records of the
+#			  intermediate file, bcp rows written to /dev/null
+#      in the copy engine load's process:
+#	reserveKeys copy - process.initialize() and process.reserveKeys()
+#	process copy	- delete, read the intermediate file, render and copy
+#			  the rows, commit
+#
+#      The database is fakedb.py; LOG_DEBUG is true so nothing is bcp'd,
+#      the copy engine load runs with LOG_DEBUG false. fakedb.py keeps the
+#      copied rows in memory, so they are part of its peak memory
+#
+###########################################################################
+
+import sys
+import os
+import json
+import time
+import collections
+import types
+import shutil
+import resource
+import tempfile
+import subprocess
+
+import gensssom
+import fakedb
+
+benchDir = os.path.dirname(os.path.abspath(__file__))
+binDir = os.path.join(os.path.dirname(benchDir), 'bin')
+
+defaultSizes = [10000, 100000, 1000000]
+
+# marks the result line of a size run
+RESULT = 'BENCH_RESULT '
+
+# the dupe rate of the --dedup files unless BENCH_DUPE_RATE is set
+dedupDupeRate = 0.5
+
+# the rate of each environment variable, see gensssom.writeFile()
+rateVariables = {'BENCH_DUPE_RATE' : 'dupeRate', 'BENCH_INVALID_RATE' : 'invalidRate',
+    'BENCH_NONPREFERRED_RATE' : 'nonPreferredRate', 'BENCH_LABEL_RATE' : 'labelRate'}
+
+#
+# Purpose: read the generator's rates from the environment
+# Returns: dictionary of rate name -> fraction, the rates that are set
+# Assumes: Nothing
+# Effects: Nothing
+# Throws: ValueError if a rate is not a number
+#
+def generatorRates():
+
+    return dict([(name, float(os.environ[var])) for var, name in rateVariables.items() if os.getenv(var)])
+
+#
+# Purpose: peak resident memory of this process so far
+# Returns: megabytes
+# Assumes: Linux, where ru_maxrss is in kilobytes
+# Effects: Nothing
+# Throws: Nothing
+#
+def peakRss():
+
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+#
+# Purpose: set up the environment the load reads its configuration from
+# Returns: Nothing
+# Assumes: Nothing
+# Effects: sets os.environ
+# Throws: Nothing
+#
+def setEnvironment(workDir, fileNames):
+
+    outputDir = os.path.join(workDir, 'output')
+    os.mkdir(outputDir)
+
+    os.environ.update({
+        'DOWNLOAD_DIR' : workDir,
+        'INPUT_FILE_NAMES' : ' '.join(fileNames),
+        'PREDICATES_TO_LOAD' : 'skos:broadMatch, skos:closeMatch, skos:exactMatch, skos:narrowMatch, skos:relatedMatch, unspecified',
+        'OUTPUTDIR' : outputDir,
+        'INPUT_FILE_TOLOAD' : os.path.join(outputDir, 'mp_hpmapping_toload.txt'),
+        'RELATIONSHIP_BCP' : 'MGI_Relationship.bcp',
+        'PROPERTY_BCP' : 'MGI_Relationship_Property.bcp',
+        'LOG_DIAG' : os.path.join(workDir, 'diag.log'),
+        'LOG_CUR' : os.path.join(workDir, 'cur.log'),
+        'LOG_CUR_JSON' : '',
+        'LOG_DEBUG' : 'true',
+        'USE_LOOKUP_CACHE' : 'false',
+        'LOAD_MODE' : 'full',
+        'LOAD_ENGINE' : 'bcp',
+        'PG_DBUTILS' : workDir,
+        'MGD_DBSERVER' : 'bench',
+        'MGD_DBNAME' : 'bench',
+        'MGD_DBUSER' : 'bench',
+        'MGD_DBPASSWORDFILE' : os.devnull,
+        })
+    os.environ.setdefault('PARSE_WORKERS', '1')
+
+#
+# Purpose: make the load's database modules importable: fakedb as db, and
+#	the MGI library modules only if they are not installed
+# Returns: Nothing
+# Assumes: Nothing
+# Effects: modifies sys.modules and sys.path
+# Throws: Nothing
+#
+def installModules():
+
+    sys.modules['db'] = fakedb
+
+    try:
+        import mgi_utils
+    except ImportError:
+        mgi_utils = types.ModuleType('mgi_utils')
+        mgi_utils.date = lambda format='%c': time.strftime(format)
+        sys.modules['mgi_utils'] = mgi_utils
+
+    try:
+        import Set
+    except ImportError:
+        sys.modules['Set'] = types.ModuleType('Set')
+
+    sys.path.insert(0, binDir)
+
+#
+# Purpose: time one stage of a script run
+# Returns: Nothing
+# Assumes: Nothing
+# Effects: adds the stage to result
+# Throws: RuntimeError if function returns an error code
+#
+def timeStage(result, name, rowCount, function):
+
+    start = time.perf_counter()
+    rc = function()
+    seconds = time.perf_counter() - start
+    if rc:
+        raise RuntimeError('%s returned %s' % (name, rc))
+    addStage(result, name, seconds, rowCount)
+
+def addStage(result, name, seconds, rowCount):
+    result['stages'].append({'stage' : name, 'seconds' : seconds, 'rows' : rowCount,
+        'rowsPerSecond' : rowCount / seconds if seconds else 0, 'peakRssMb' : peakRss()})
+
+#
+# Purpose: run the preprocessor on the generated files
+# Returns: Nothing
+# Assumes: setEnvironment() has been run, in a process of its own
+# Effects: writes the intermediate file, adds the stages to result
+# Throws: RuntimeError if a stage fails
+#
+def runPreprocess(result, rows):
+
+    import preprocess
+
+    def parse():
+        return preprocess.openFiles() or preprocess.parseInputFiles() or preprocess.closeFiles()
+
+    timeStage(result, 'initialize', len(fakedb.terms), preprocess.initialize)
+    timeStage(result, 'parseInputFiles', rows, parse)
+
+#
+# Purpose: run the load on the intermediate file of runPreprocess()
+# Returns: Nothing
+# Assumes: setEnvironment() has been run, in a process of its own
+# Effects: writes the bcp files, adds the stages to result
+# Throws: RuntimeError if a stage fails
+#
+def runProcess(result, rows):
+
+    import process
+
+    def reserve():
+        return process.initialize() or process.reserveKeys()
+
+    def load():
+        return process.process() or process.closeFiles()
+
+    def render():
+        fp = open(os.environ['INPUT_FILE_TOLOAD'], 'r')
+        process.fpRelationshipFile = open(os.devnull, 'w')
+        process.fpPropertyFile = open(os.devnull, 'w')
+        seconds = 0
+        chunk = []
+        for tokens in process.readRecords(fp):
+            chunk.append(tokens)
+            if len(chunk) == process.rowBufferSize:
+                seconds += renderChunk(chunk)
+                chunk = []
+        seconds += renderChunk(chunk)
+        fp.close()
+        process.closeFiles()
+        return seconds
+
+    def renderChunk(chunk):
+        start = time.perf_counter()
+        for tokens in chunk:
+            process.processRecord(tokens)
+        return time.perf_counter() - start
+
+    fp = open(os.environ['INPUT_FILE_TOLOAD'], 'r')
+    goodCount = sum(1 for line in fp)
+    fp.close()
+    result['goodRows'] = goodCount
+
+    timeStage(result, 'reserveKeys', goodCount, reserve)
+    timeStage(result, 'process', goodCount, load)
+
+    # only the processRecord() calls are timed
+    addStage(result, 'render', render(), goodCount)
+
+#
+# Purpose: run the load on the intermediate file of runPreprocess() with
+#	the copy engine and check the rows it copied
+# Returns: Nothing
+# Assumes: runProcess() wrote the bcp files, in a process of its own
+# Effects: adds the stages to result
+# Throws: RuntimeError if a stage fails or the copied rows are not the
+#	rows of the bcp files
+#
+def runCopy(result, rows):
+
+    # LOG_DEBUG would skip the copy
+    os.environ.update({'LOAD_ENGINE' : 'copy', 'LOG_DEBUG' : 'false'})
+
+    import process
+
+    def reserve():
+        return process.initialize() or process.reserveKeys()
+
+    def load():
+        return process.doDeletes() or process.process() or process.closeFiles() or process.bcpFiles()
+
+    fp = open(os.environ['INPUT_FILE_TOLOAD'], 'r')
+    goodCount = sum(1 for line in fp)
+    fp.close()
+
+    timeStage(result, 'reserveKeys copy', goodCount, reserve)
+    timeStage(result, 'process copy', goodCount, load)
+
+    for table, fileName in ((process.relTable, process.relationshipFile), (process.propTable, process.propertyFile)):
+        fp = open(fileName, 'r')
+        bcpRows = fp.read()
+        fp.close()
+        if ''.join(fakedb.copied.get('mgd.' + table, [])) != bcpRows:
+            raise RuntimeError('the rows copied into %s are not the rows of %s' % (table, fileName))
+
+# the scripts of a size run, in order, each in a process of its own
+scripts = ['preprocess', 'process', 'copy']
+runners = {'preprocess' : runPreprocess, 'process' : runProcess, 'copy' : runCopy}
+
+#
+# Purpose: run one script of a size, in this process
+# Returns: the results dictionary
+# Assumes: the environment was set up by runSize()
+# Effects: see runPreprocess(), runProcess(); stdout of the load goes
+#	to stderr
+# Throws: Nothing
+#
+def runScript(script, rows):
+
+    result = {'script' : script, 'stages' : []}
+
+    installModules()
+
+    stdout = sys.stdout
+    sys.stdout = sys.stderr
+    try:
+        runners[script](result, rows)
+    finally:
+        sys.stdout = stdout
+
+    result['peakRssMb'] = peakRss()
+    result['statements'] = fakedb.statementCounts
+
+    return result
+
+#
+# Purpose: benchmark one size: generate the files, then run each script
+#	in a process of its own
+# Returns: the results dictionary, None if a script failed
+# Assumes: Nothing
+# Effects: writes to a temporary directory, sets os.environ
+# Throws: Nothing
+#
+def runSize(rows):
+
+    workDir = tempfile.mkdtemp(prefix='mp_hpbench.')
+    result = {'rows' : rows, 'stages' : [], 'peakRssMb' : {}, 'statements' : {}}
+
+    try:
+        start = time.perf_counter()
+        fileNames = gensssom.writeFiles(workDir, rows, **generatorRates())
+        result['generateSeconds'] = time.perf_counter() - start
+
+        setEnvironment(workDir, fileNames)
+
+        for script in scripts:
+            p = subprocess.run([sys.executable, os.path.abspath(__file__), '--run', script, str(rows)],
+                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, universal_newlines=True)
+            lines = [l for l in p.stdout.splitlines() if l.startswith(RESULT)]
+            if p.returncode != 0 or not lines:
+                print('%s rows: %s failed (exit %s)' % (rows, script, p.returncode))
+                return None
+            scriptResult = json.loads(lines[-1][len(RESULT):])
+            result['stages'] += scriptResult['stages']
+            result['peakRssMb'][script] = scriptResult['peakRssMb']
+            result['goodRows'] = scriptResult.get('goodRows', result.get('goodRows'))
+            for kind, n in scriptResult['statements'].items():
+                result['statements'][kind] = result['statements'].get(kind, 0) + n
+    finally:
+        if os.getenv('BENCH_KEEP') == 'true':
+            sys.stderr.write('kept: %s\n' % workDir)
+        else:
+            shutil.rmtree(workDir)
+
+    return result
+
+#
+# Purpose: run each size and report
+# Returns: 0, 1 if a size failed
+# Assumes: Nothing
+# Effects: writes the report to stdout
+# Throws: Nothing
+#
+def main(sizes):
+
+    results = []
+    for rows in sizes:
+        result = runSize(rows)
+        if result is None:
+            return 1
+        results.append(result)
+
+    print('%-10s %-16s %10s %14s %12s' % ('rows', 'stage', 'seconds', 'rows/second', 'peak RSS MB'))
+    for result in results:
+        for s in result['stages']:
+            print('%-10s %-16s %10.3f %14.0f %12.1f' % (result['rows'], s['stage'], s['seconds'], s['rowsPerSecond'], s['peakRssMb']))
+        print('%-10s %-16s %s of %s rows loaded' % (result['rows'], 'good', result['goodRows'], result['rows']))
+
+    print('')
+    print('%-10s %18s %18s %18s' % ('rows', 'preprocess RSS MB', 'process RSS MB', 'copy RSS MB'))
+    for result in results:
+        peakRssMb = result['peakRssMb']
+        print('%-10s %18.1f %18.1f %18.1f' % (result['rows'], peakRssMb['preprocess'], peakRssMb['process'], peakRssMb['copy']))
+
+    return 0
+
+#
+# Purpose: read and tokenize the generated files, so only the QC is timed
+# Returns: list of (fileName, tokenized records), in file order
+# Assumes: installModules() has been run
+# Effects: reads the files
+# Throws: Nothing
+#
+def tokenizeFiles(workDir, fileNames):
+
+    import preprocess
+
+    files = []
+    for fileName in fileNames:
+        fp = preprocess.openInputFile(workDir, fileName)
+        files.append((fileName, list(preprocess.tokenizeLines(fileName, preprocess.readLines(fp)))))
+        fp.close()
+
+    return files
+
+#
+# Purpose: run MappingValidator.validateRecords() over the tokenized files
+#	with a new dupe set, as parseInputFiles() does
+# Returns: (seconds, counts)
+# Assumes: Nothing
+# Effects: Nothing
+# Throws: Nothing
+#
+def validate(validator, files):
+
+    import preprocess
+
+    counts = collections.Counter()
+    dupeSet = set()
+    qc = preprocess.QcEventSink()
+
+    start = time.perf_counter()
+    for fileName, records in files:
+        qc.startFile(fileName)
+        for record in validator.validateRecords(fileName, records, counts, dupeSet, qc):
+            pass
+    seconds = time.perf_counter() - start
+
+    return seconds, counts
+
+#
+# Purpose: time the preprocessor's QC, duplicate check included, at each
+#	size on files with a high dupe rate and on the same size without dupes
+# Returns: 0
+# Assumes: Nothing
+# Effects: writes to a temporary directory, writes the report to stdout
+# Throws: Nothing
+#
+def dedupMain(sizes):
+
+    rates = generatorRates()
+    rates.setdefault('dupeRate', dedupDupeRate)
+    # the baseline: the same files but for the dupes, lookups and QC only
+    baselineRates = dict(rates, dupeRate=0.0)
+    installModules()
+
+    import loadconfig
+    import preprocess
+
+    print('%-10s %10s %12s %12s %16s' % ('rows', 'dupes', 'seconds', 'ns/row', 'no dupes ns/row'))
+    for rows in sizes:
+        timings = []
+        for fileRates in (rates, baselineRates):
+            workDir = tempfile.mkdtemp(prefix='mp_hpbench.')
+            try:
+                fileNames = gensssom.writeFiles(workDir, rows, **fileRates)
+                setEnvironment(workDir, fileNames)
+                stdout = sys.stdout
+                sys.stdout = sys.stderr
+                try:
+                    config = loadconfig.LoadConfig()
+                    lookups = preprocess.TermLookups()
+                    preprocess.loadLookups(config, lookups)
+                    validator = preprocess.MappingValidator(config, lookups)
+                    files = tokenizeFiles(workDir, fileNames)
+                finally:
+                    sys.stdout = stdout
+            finally:
+                shutil.rmtree(workDir)
+
+            # the best of 3, the dupe set is built from scratch each time
+            best = None
+            for i in range(3):
+                timing = validate(validator, files)
+                if best is None or timing[0] < best[0]:
+                    best = timing
+            timings.append(best)
+
+        (seconds, counts), (baselineSeconds, baselineCounts) = timings
+        print('%-10s %10s %12.3f %12.0f %16.0f' % (rows, counts['dupe'], seconds, 
+            seconds * 1e9 / max(counts['record'], 1), baselineSeconds * 1e9 / max(baselineCounts['record'], 1)))
+
+    return 0
+
+#
+# Purpose: render the bcp rows of records with % formatting, one row at a
+#	time, as process.py did before RowRenderer
+# Returns: list of rows
+# Assumes: process has been imported
+# Effects: Nothing
+# Throws: Nothing
+#
+def formatRows(records):
+
+    import process
+
+    TAB = process.TAB
+    CRT = process.CRT
+    DATE = process.DATE
+    userKey = process.userKey
+
+    rows = []
+    relationshipKey = 1
+    propertyKey = 1
+    for record in records:
+        rows.append('%s%s%s%s%s%s%s%s%s%s%s%s%s%s%s%s%s%s%s%s%s%s%s%s' % \
+            (relationshipKey, TAB, process.catKey, TAB, record.mpKey, TAB, record.hpKey, TAB, process.relKey, TAB, 
+            process.qualKey, TAB, process.evidKey, TAB, process.refsKey, TAB, userKey, TAB, userKey, TAB, DATE, TAB, DATE, CRT))
+
+        for propNameKey, value, seqNum in ((process.predPropNameKey, record.predicate, process.predSeqNum),
+                (process.justPropNameKey, record.justification, process.justSeqNum),
+                (process.filePropNameKey, record.fileName, process.fileSeqNum),
+                (process.hpLabelPropNameKey, record.hpTermLabel, process.hpLabelSeqNum),
+                (process.mpLabelPropNameKey, record.mpTermLabel, process.mpLabelSeqNum)):
+            rows.append('%s%s%s%s%s%s%s%s%s%s%s%s%s%s%s%s%s%s' % (propertyKey, TAB, relationshipKey, TAB, 
+                propNameKey, TAB, value, TAB, seqNum, TAB, userKey, TAB, userKey, TAB, DATE, TAB, DATE, CRT))
+            propertyKey += 1
+
+        relationshipKey += 1
+
+    return rows
+
+#
+# Purpose: render the bcp rows of records with process.RowRenderer, as
+#	process.processRecord() does
+# Returns: list of rows
+# Assumes: process has been imported
+# Effects: Nothing
+# Throws: Nothing
+#
+def renderRows(records):
+
+    import process
+
+    renderer = process.RowRenderer(process.userKey, process.DATE)
+
+    rows = []
+    propertyKey = 1
+    for i, record in enumerate(records):
+        relationshipKey = str(i + 1)
+        rows.append(renderer.relationship(relationshipKey, record.mpKey, record.hpKey))
+        rows.append(renderer.properties(map(str, range(propertyKey, propertyKey + 5)), relationshipKey, record))
+        propertyKey += 5
+
+    return rows
+
+#
+# Purpose: time both renderers at each size and report
+# Returns: 0, 1 if they do not render the same rows
+# Assumes: Nothing
+# Effects: writes to a temporary directory, writes the report to stdout
+# Throws: Nothing
+#
+def renderMain(sizes):
+
+    installModules()
+
+    print('%-10s %-12s %10s %14s' % ('rows', 'renderer', 'seconds', 'records/second'))
+    for rows in sizes:
+        workDir = tempfile.mkdtemp(prefix='mp_hpbench.')
+        try:
+            fileNames = gensssom.writeFiles(workDir, rows, **generatorRates())
+            setEnvironment(workDir, fileNames)
+            stdout = sys.stdout
+            sys.stdout = sys.stderr
+            try:
+                import preprocess
+                import process
+                preprocess.initialize()
+                preprocess.openFiles()
+                preprocess.parseInputFiles()
+                preprocess.closeFiles()
+                preprocess.lookups.clear()
+            finally:
+                sys.stdout = stdout
+
+            fp = open(os.environ['INPUT_FILE_TOLOAD'], 'r')
+            records = list(process.readRecords(fp))
+            fp.close()
+        finally:
+            shutil.rmtree(workDir)
+
+        output = {}
+        for name, function in (('% format', formatRows), ('RowRenderer', renderRows)):
+            # the best of 3
+            seconds = None
+            for i in range(3):
+                start = time.perf_counter()
+                output[name] = function(records)
+                elapsed = time.perf_counter() - start
+                if seconds is None or elapsed < seconds:
+                    seconds = elapsed
+            print('%-10s %-12s %10.3f %14.0f' % (rows, name, seconds, len(records) / seconds if seconds else 0))
+
+        if ''.join(output['% format']) != ''.join(output['RowRenderer']):
+            print('%s rows: the renderers do not render the same rows' % rows)
+            return 1
+
+    return 0
+
+#
+# Purpose: time parseInputFiles() with each validation engine on the same
+#	files and check they write the same intermediate file and curation logs
+# Returns: 0, 1 if numpy is not installed or the engines do not write the
+#	same files
+# Assumes: Nothing
+# Effects: writes to a temporary directory, writes the report to stdout
+# Throws: RuntimeError if parseInputFiles() fails
+#
+def columnarMain(sizes):
+
+    installModules()
+
+    import preprocess
+
+    if preprocess.numpy is None:
+        print('--columnar needs numpy')
+        return 1
+
+    print('%-10s %-10s %10s %14s %10s' % ('rows', 'engine', 'seconds', 'rows/second', 'good'))
+    for rows in sizes:
+        workDir = tempfile.mkdtemp(prefix='mp_hpbench.')
+        try:
+            fileNames = gensssom.writeFiles(workDir, rows, **generatorRates())
+            setEnvironment(workDir, fileNames)
+            stdout = sys.stdout
+            sys.stdout = sys.stderr
+            try:
+                if preprocess.initialize() or preprocess.waitForLookups():
+                    raise RuntimeError('preprocess.initialize() failed')
+            finally:
+                sys.stdout = stdout
+
+            outputs = {}
+            for engine in ('row', 'columnar'):
+                preprocess.validator.columnar = engine == 'columnar'
+                outputs[engine] = [os.path.join(workDir, '%s.%s' % (engine, name)) for name in ('toload', 'cur.log', 'cur.json')]
+                preprocess.inputFileInt, preprocess.logCurFile, preprocess.logCurJsonFile = outputs[engine]
+
+                # the best of 3, the curation log is appended to so it is
+                # removed before each run
+                seconds = None
+                for i in range(3):
+                    if os.path.exists(preprocess.logCurFile):
+                        os.remove(preprocess.logCurFile)
+                    sys.stdout = sys.stderr
+                    try:
+                        start = time.perf_counter()
+                        if preprocess.openFiles() or preprocess.parseInputFiles() or preprocess.closeFiles():
+                            raise RuntimeError('parseInputFiles() failed with VALIDATION_ENGINE=%s' % engine)
+                        elapsed = time.perf_counter() - start
+                    finally:
+                        sys.stdout = stdout
+                    if seconds is None or elapsed < seconds:
+                        seconds = elapsed
+
+                fp = open(preprocess.inputFileInt, 'r')
+                goodCount = sum(1 for line in fp)
+                fp.close()
+                print('%-10s %-10s %10.3f %14.0f %10s' % (rows, engine, seconds, rows / seconds if seconds else 0, goodCount))
+
+            for rowFile, columnarFile in zip(outputs['row'], outputs['columnar']):
+                fp = open(rowFile, 'rb')
+                rowBytes = fp.read()
+                fp.close()
+                fp = open(columnarFile, 'rb')
+                columnarBytes = fp.read()
+                fp.close()
+                if rowBytes != columnarBytes:
+                    print('%s rows: the engines do not write the same %s' % (rows, os.path.basename(rowFile)[len('row.'):]))
+                    return 1
+        finally:
+            shutil.rmtree(workDir)
+
+    return 0
+
+#
+#  MAIN
+#
+
+if __name__ == '__main__':
+    if len(sys.argv) == 4 and sys.argv[1] == '--run':
+        print(RESULT + json.dumps(runScript(sys.argv[2], int(sys.argv[3]))))
+        sys.exit(0)
+
+    if len(sys.argv) > 1 and sys.argv[1] == '--render':
+        sys.exit(renderMain([int(a) for a in sys.argv[2:]] or defaultSizes))
+
+    if len(sys.argv) > 1 and sys.argv[1] == '--columnar':
+        sys.exit(columnarMain([int(a) for a in sys.argv[2:]] or defaultSizes))
+
+    if len(sys.argv) > 1 and sys.argv[1] == '--dedup':
+        sys.exit(dedupMain([int(a) for a in sys.argv[2:]] or defaultSizes))
+
+    sys.exit(main([int(a) for a in sys.argv[1:]] or defaultSizes))
@@ -0,0 +1,123 @@
+#
+#  fakedb.py
+###########################################################################
+#
+#  Purpose:
+#
+#      In-memory stand-in for the MGI db module, answering the queries
+#      the load makes from the synthetic vocabulary in gensssom.py
+#
+#  Usage:
+#
+#      bench.py installs it as sys.modules['db'] before preprocess and
+#      process are imported
+#
+#  Notes:
+#
+#      Handles the MP/HP lookup and lookup signature queries, the key
+#      reservations of process.KeyBlock and the existing relationships
+#      query (none exist); everything else (deletes, updates) is counted
+#      and ignored
+#
+#      sharedConnection stands in for the connection of useOneConnection(1),
+#      which process.py's copy engine streams its rows on; the rows are
+#      kept in copied
+#
+###########################################################################
+
+import re
+
+import gensssom
+
+terms = gensssom.vocabulary()
+
+sequences = {}
+
+# number of statements by kind, reported by bench.py
+statementCounts = {}
+
+# the rows streamed with COPY FROM STDIN, by table: {'mgd.MGI_Relationship' : [rows, ...], ...}
+copied = {}
+
+class FakeCursor:
+
+    def copy_expert(self, statement, fp):
+        count('copy')
+        copied.setdefault(str.split(statement)[1], []).append(fp.read())
+
+class FakeConnection:
+
+    def cursor(self):
+        return FakeCursor()
+
+sharedConnection = FakeConnection()
+
+def useOneConnection(flag):
+    pass
+
+def set_sqlUser(user):
+    pass
+
+def set_sqlPasswordFromFile(passwordFileName):
+    pass
+
+def commit():
+    count('commit')
+
+def count(kind):
+    statementCounts[kind] = statementCounts.get(kind, 0) + 1
+
+#
+# Purpose: answer the MP/HP lookup query, honouring a logical db list,
+#	a preferred restriction and an accid list if the query has them
+# Returns: list of row dictionaries
+# Assumes: Nothing
+# Effects: Nothing
+# Throws: Nothing
+#
+def lookupRows(query):
+
+    logicalDBKeys = None
+    m = re.search(r'_logicaldb_key\s+in\s+\(([^)]*)\)', query) or re.search(r'_logicaldb_key\s*=\s*(\d+)', query)
+    if m:
+        logicalDBKeys = set([int(k) for k in m.group(1).split(',')])
+
+    preferred = None
+    m = re.search(r'a\.preferred\s*=\s*(\d)', query)
+    if m:
+        preferred = int(m.group(1))
+
+    accIDs = None
+    m = re.search(r'accid\s+in\s+\(([^)]*)\)', query)
+    if m:
+        accIDs = set([s.strip().strip("'") for s in m.group(1).split(',')])
+
+    return [{'accid' : accid, '_logicaldb_key' : logicalDBKey, 'preferred' : pref,
+            '_object_key' : objectKey, 'term' : term}
+        for accid, logicalDBKey, pref, objectKey, term in terms
+        if (logicalDBKeys is None or logicalDBKey in logicalDBKeys)
+            and (preferred is None or pref == preferred)
+            and (accIDs is None or accid in accIDs)]
+
+def sql(query, mode='auto'):
+
+    m = re.search(r"nextval\('(\w+)'\).*generate_series\(1, (\d+)\)", query, re.S)
+    if m:
+        count('reserve')
+        sequence, n = m.group(1), int(m.group(2))
+        start = sequences.get(sequence, 0) + 1
+        sequences[sequence] = start + n - 1
+        return [{'startKey' : start, 'endKey' : start + n - 1}]
+
+    if 'count(*) as rowCt' in query:
+        count('signature')
+        return [{'_logicaldb_key' : k, 'rowCt' : len([t for t in terms if t[1] == k]),
+                'accDate' : '2026-01-01', 'termDate' : '2026-01-01'}
+            for k in (gensssom.MP_LOGICALDB, gensssom.HP_LOGICALDB)]
+
+    if 'acc_accession' in query and 'voc_term' in query:
+        count('lookup')
+        return lookupRows(query)
+
+    count(str.split(str.strip(query))[0].lower())
+    return []
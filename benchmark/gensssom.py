@@ -0,0 +1,216 @@
+#
+#  gensssom.py
+###########################################################################
+#
+#  Purpose:
+#
+#      Generate a synthetic MP/HP vocabulary and synthetic SSSOM mapping
+#      files against it, for benchmarking the load without mgd or the
+#      real download directory
+#
+#  Usage:
+#
+#      gensssom.py [-d dupeRate] [-i invalidRate] [-n nonPreferredRate]
+#          [-l labelRate] outputDir rows [nFiles]
+#
+#  Outputs:
+#
+#      nFiles SSSOM files in outputDir, rows mappings in all, named
+#      mp_hp_bench_N.sssom.tsv; the vocabulary is regenerated from the
+#      same seed by the benchmark's fake db (see fakedb.py)
+#
+#  Notes:
+#
+#      Like the real files each one has a comment header, a column order
+#      of its own and columns the load does not parse. Rates are fractions
+#      of the rows:
+#	dupeRate	  - a repeat of an earlier mapping of the same file
+#	invalidRate	  - an MP or HP ID not in the vocabulary, a blank ID,
+#			    sssom:NoTermFound or a predicate not loaded
+#	nonPreferredRate  - a non-preferred MP or HP ID
+#	labelRate	  - a subject/object label that differs from the term
+#
+#      The defaults are those of writeFile()
+#
+###########################################################################
+
+import sys
+import getopt
+import random
+
+TAB = '\t'
+CRT = '\n'
+
+USAGE = 'Usage: gensssom.py [-d dupeRate] [-i invalidRate] [-n nonPreferredRate] [-l labelRate] outputDir rows [nFiles]'
+
+# the rate of each command line option
+rateOptions = {'-d' : 'dupeRate', '-i' : 'invalidRate', '-n' : 'nonPreferredRate', '-l' : 'labelRate'}
+
+MP_LOGICALDB = 34
+HP_LOGICALDB = 180
+
+mpTermCount = 14000
+hpTermCount = 18000
+
+# every nonPreferredStep-th term has a non-preferred (secondary) ID
+nonPreferredStep = 10
+
+predicates = ['skos:exactMatch', 'skos:broadMatch', 'skos:narrowMatch', 'skos:closeMatch', 'skos:relatedMatch']
+justifications = ['semapv:LexicalMatching', 'semapv:ManualMappingCuration']
+
+columns = ['subject_id', 'subject_label', 'predicate_id', 'object_id', 'object_label', 'mapping_justification']
+extraColumns = ['confidence', 'author_id', 'subject_source', 'object_source', 'comment']
+
+#
+# Purpose: build the synthetic vocabulary
+# Returns: list of (accid, logicalDBKey, preferred, objectKey, term), the
+#	columns of the preprocessor's lookup query
+# Assumes: Nothing
+# Effects: Nothing
+# Throws: Nothing
+#
+def vocabulary():
+
+    terms = []
+    for prefix, logicalDBKey, count, keyBase in (('MP', MP_LOGICALDB, mpTermCount, 1000000),
+            ('HP', HP_LOGICALDB, hpTermCount, 2000000)):
+        for i in range(count):
+            term = '%s synthetic term %s' % (prefix, i)
+            terms.append(('%s:%07d' % (prefix, i), logicalDBKey, 1, keyBase + i, term))
+            if i % nonPreferredStep == 0:
+                terms.append(('%s:%07d' % (prefix, 5000000 + i), logicalDBKey, 0, keyBase + i, term))
+
+    return terms
+
+#
+# Purpose: pick an ID and its label
+# Returns: (id, label)
+# Assumes: Nothing
+# Effects: uses rng
+# Throws: Nothing
+#
+def pickTerm(rng, prefix, count, nonPreferredRate, labelRate):
+
+    i = rng.randrange(count)
+    label = '%s synthetic term %s' % (prefix, i)
+
+    if rng.random() < nonPreferredRate:
+        i = i - i % nonPreferredStep + 5000000
+
+    if rng.random() < labelRate:
+        label = label.upper() + ' (obsolete label)'
+
+    return '%s:%07d' % (prefix, i), label
+
+#
+# Purpose: generate one mapping row
+# Returns: dictionary of column -> value
+# Assumes: Nothing
+# Effects: uses rng
+# Throws: Nothing
+#
+def makeRow(rng, invalidRate, nonPreferredRate, labelRate):
+
+    mpID, mpLabel = pickTerm(rng, 'MP', mpTermCount, nonPreferredRate, labelRate)
+    hpID, hpLabel = pickTerm(rng, 'HP', hpTermCount, nonPreferredRate, labelRate)
+    predicate = rng.choice(predicates)
+
+    if rng.random() < invalidRate:
+        kind = rng.randrange(6)
+        if kind == 0:
+            mpID = 'MP:9%06d' % rng.randrange(1000000)
+        elif kind == 1:
+            hpID = 'HP:9%06d' % rng.randrange(1000000)
+        elif kind == 2:
+            hpID = 'sssom:NoTermFound'
+        elif kind == 3:
+            mpID = ''
+        elif kind == 4:
+            hpID = ''
+        else:
+            predicate = 'skos:relatedSynonym'
+
+    return {'subject_id' : mpID,
+        'subject_label' : mpLabel,
+        'predicate_id' : predicate,
+        'object_id' : hpID,
+        'object_label' : hpLabel,
+        'mapping_justification' : rng.choice(justifications),
+        'confidence' : '%.2f' % rng.random(),
+        'author_id' : 'orcid:0000-0000-0000-0000',
+        'subject_source' : 'obo:mp',
+        'object_source' : 'obo:hp',
+        'comment' : 'synthetic'}
+
+#
+# Purpose: write one synthetic SSSOM file
+# Returns: Nothing
+# Assumes: Nothing
+# Effects: writes fileName
+# Throws: IOError
+#
+def writeFile(fileName, rows, seed, dupeRate=0.05, invalidRate=0.02, nonPreferredRate=0.01, labelRate=0.01):
+
+    rng = random.Random(seed)
+
+    header = columns + rng.sample(extraColumns, rng.randrange(len(extraColumns) + 1))
+    rng.shuffle(header)
+
+    fp = open(fileName, 'w')
+    fp.write('# curie_map:%s#   HP: http://purl.obolibrary.org/obo/HP_%s#   MP: http://purl.obolibrary.org/obo/MP_%s' % (CRT, CRT, CRT))
+    fp.write('# mapping_set_id: synthetic%s' % CRT)
+    fp.write(TAB.join(header) + CRT)
+
+    # a window of recent rows to repeat, so dupes are spread over the file
+    recent = []
+    for i in range(rows):
+        if recent and rng.random() < dupeRate:
+            row = rng.choice(recent)
+        else:
+            row = makeRow(rng, invalidRate, nonPreferredRate, labelRate)
+            recent.append(row)
+            if len(recent) > 1000:
+                recent.pop(rng.randrange(len(recent)))
+        fp.write(TAB.join([row[c] for c in header]) + CRT)
+
+    fp.close()
+
+#
+# Purpose: write nFiles synthetic SSSOM files
+# Returns: the file names, as for INPUT_FILE_NAMES
+# Assumes: outputDir exists
+# Effects: writes the files
+# Throws: IOError
+#
+def writeFiles(outputDir, rows, nFiles=6, **rates):
+
+    fileNames = []
+    for n in range(nFiles):
+        fileName = 'mp_hp_bench_%s.sssom.tsv' % n
+        fileRows = rows // nFiles + (n < rows % nFiles)
+        writeFile('%s/%s' % (outputDir, fileName), fileRows, n, **rates)
+        fileNames.append(fileName)
+
+    return fileNames
+
+#
+#  MAIN
+#
+
+if __name__ == '__main__':
+    try:
+        options, args = getopt.getopt(sys.argv[1:], 'd:i:n:l:')
+        rates = dict([(rateOptions[o], float(v)) for o, v in options])
+    except (getopt.GetoptError, ValueError) as e:
+        sys.stderr.write('%s\n%s\n' % (e, USAGE))
+        sys.exit(1)
+
+    if len(args) not in (2, 3):
+        sys.stderr.write('%s\n' % USAGE)
+        sys.exit(1)
+
+    nFiles = 6
+    if len(args) == 3:
+        nFiles = int(args[2])
+
+    print(' '.join(writeFiles(args[0], int(args[1]), nFiles, **rates)))
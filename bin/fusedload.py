@@ -0,0 +1,185 @@
+#
+#  fusedload.py
+###########################################################################
+#
+#  Purpose:
+#
+#      Run the preprocessor and the load in one process: the records
+#      validated by preprocess.parseInputFiles() are passed in memory to
+#      process.processRecord() instead of through the intermediate file
+#
+#  Usage:
+#
+#      fusedload.py
+#
+#  Env Vars:
+#	See the configuration file (mp_hpmappingload.config)
+#	WRITE_INTERMEDIATE_FILE - if 'true' INPUT_FILE_TOLOAD is still
+#	    written, as a debug artifact
+#
+#  Inputs:
+#      The set of files specified by INPUT_FILE_NAMES and found in
+#       DOWNLOAD_DIR
+#
+#  Outputs:
+#
+#       1. MGI_Relationship.bcp
+#       2. MGI_Relationship_Property.bcp
+#       3. optionally the intermediate file INPUT_FILE_TOLOAD
+#
+#  Exit Codes:
+#
+#      0:  Successful completion
+#      1:  An exception occurred
+#
+#  Implementation:
+#
+#      This script will perform following steps:
+#
+#      1) initialize the load - one database connection, output files,
+#	  sequence keys
+#      2) initialize the preprocessor - lookups, log files
+#      3) parse the input files, each record that passes QC goes
+#	  straight to the bcp files
+#      4) close files
+#      5) delete existing relationships
+#      6) BCP in new relationships
+#
+#      With RESUME_LOAD a rerun of an interrupted load skips steps 2-4 if
+#      the bcp files were written, and the deletes and each bcp that
+#      completed (see loadcheckpoint.py)
+#
+#  Notes:  None
+#
+###########################################################################
+
+import sys
+import time
+
+import loadconfig
+import loadcheckpoint
+import loadmetrics
+import preprocess
+import process
+
+#
+# Purpose: strip a validated record the way process.readRecords() strips
+#	a line of the intermediate file and process it
+# Returns: Nothing
+# Assumes: process has been initialized
+# Effects: writes to the bcp files
+# Throws: Nothing
+#
+def processRecord(record):
+
+    process.processRecord(record.stripped())
+
+#
+# Purpose: run the fused load
+# Returns: Nothing
+# Assumes: Nothing
+# Effects: exits with 0 on success, 1 on error
+# Throws: Nothing
+#
+def main():
+
+    # both halves of the load run with the same settings
+    config = loadconfig.LoadConfig()
+    preprocess.writeIntermediateFile = config.writeIntermediateFile
+
+    # one set of timings for both halves of the load
+    metrics = loadmetrics.LoadMetrics('fusedload', config)
+    preprocess.metrics = metrics
+    process.metrics = metrics
+
+    # sets the database user, the preprocessor shares the connection
+    with metrics.stage('initialize process'):
+        if process.initialize(openInput=0, loadConfig=config) != 0:
+            print('Error in initialize')
+            sys.exit(1)
+
+    # the bcp files of an interrupted load are loaded as they are, see
+    # RESUME_LOAD
+    if not process.isResumed('render'):
+        with metrics.stage('initialize preprocess') as stage:
+            if preprocess.initialize(config) != 0:
+                sys.exit(1)
+            if preprocess.lookupThread is None:
+                stage.rows = len(preprocess.lookups)
+
+        with metrics.stage('openFiles'):
+            if preprocess.openFiles() != 0:
+                sys.exit(1)
+
+        # the lookups load in the background with CONCURRENT_STARTUP; they
+        # share the database connection, so wait for them before the
+        # statements below
+        if preprocess.lookupThread is not None:
+            with metrics.stage('checkInputHeaders'):
+                if preprocess.checkInputHeaders() != 0:
+                    sys.exit(1)
+
+            with metrics.stage('waitForLookups') as stage:
+                if preprocess.waitForLookups() != 0:
+                    sys.exit(1)
+                stage.rows = len(preprocess.lookups)
+
+        if process.diffExisting:
+            with metrics.stage('loadExisting') as stage:
+                if process.loadExisting() != 0:
+                    print('Error loading existing relationships')
+                    sys.exit(1)
+                stage.rows = len(process.existingDict)
+
+        if process.deleteFirst:
+            with metrics.stage('doDeletes') as stage:
+                if process.doDeletes() != 0:
+                    print('Error doing deletes')
+                    sys.exit(1)
+                stage.rows = process.deleteCt
+
+        with metrics.stage('parseInputFiles') as stage:
+            if preprocess.parseInputFiles(recordSink=processRecord) != 0:
+                sys.exit(1)
+
+            if process.endProcess() != 0:
+                print('Error in the process method')
+                sys.exit(1)
+            stage.rows = sum([f['rows'] for f in metrics.files])
+
+        with metrics.stage('closeFiles'):
+            preprocess.closeFiles()
+            if process.closeFiles() != 0:
+                print('Error closing files')
+                sys.exit(1)
+            process.completeRender()
+
+    if not process.deleteFirst:
+        with metrics.stage('doDeletes') as stage:
+            if process.doDeletes() != 0:
+                print('Error doing deletes')
+                sys.exit(1)
+            stage.rows = process.deleteCt
+
+    with metrics.stage('bcpFiles') as stage:
+        if process.bcpFiles() != 0:
+            print('Error executing bcp')
+            sys.exit(1)
+        if not config.debug:
+            stage.rows = process.relationshipCt
+
+    # the load is complete, a rerun starts over
+    if config.resumeLoad:
+        loadcheckpoint.discard(config.checkpointFile)
+
+    metrics.write()
+
+    print('done: %s' % time.strftime("%H.%M.%S.%m.%d.%y", time.localtime(time.time())))
+    sys.exit(0)
+
+#
+#  MAIN
+#
+
+if __name__ == '__main__':
+    main()
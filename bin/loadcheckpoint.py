@@ -0,0 +1,184 @@
+#
+#  loadcheckpoint.py
+###########################################################################
+#
+#  Purpose:
+#
+#      Record the stages of a load as they complete, with the sha256 of
+#      the files each one wrote, so a load that failed or was killed is
+#      rerun from the first stage that did not complete instead of from
+#      the start
+#
+#  Usage:
+#
+#      checkpoint = loadcheckpoint.LoadCheckpoint(config, vocabulary)
+#
+#      if not checkpoint.isComplete('render'):
+#          ...
+#          checkpoint.complete('render', [relationshipFile, propertyFile],
+#              relationships=relationshipCt)
+#
+#      loadcheckpoint.discard(config.checkpointFile)
+#
+#  Env Vars:
+#	See the configuration file (mp_hpmappingload.config)
+#	RESUME_LOAD - if 'true' the stages are recorded and resumed
+#	LOAD_CHECKPOINT - the checkpoint of the current load
+#
+#  Stages:
+#
+#      preprocess - the intermediate file INPUT_FILE_TOLOAD (preprocess.py)
+#      render - the bcp files (process.py, fusedload.py)
+#      doDeletes - the existing relationships deleted, or in delta mode
+#	   the removed ones deleted and the changed values updated
+#      loadRelationships, loadProperties - each bcp file loaded
+#
+#  Checkpoint format (JSON):
+#   {"run": {"files": {fileName: sha256, ...}, "predicates": [...],
+#	"loadMode": LOAD_MODE, "vocabulary": vocabulary signature},
+#    "stages": [{"stage": name, "artifacts": {path: sha256, ...},
+#	"info": {...}}, ...]}
+#
+#  Notes:
+#
+#      The stages are kept in the order they completed. The checkpoint
+#      is ignored when it is of other input files, predicates, load
+#      mode or MP/HP vocabularies (see preprocess.getLookupSignature());
+#      a stage whose files were changed or removed is run again and so
+#      is every stage after it
+#
+###########################################################################
+
+import os
+import json
+import hashlib
+
+#
+# Purpose: compute the sha256 of a file
+# Returns: the hex digest
+# Assumes: Nothing
+# Effects: reads the file
+# Throws: IOError if the file cannot be read
+#
+def hashFile(path):
+
+    h = hashlib.sha256()
+    fp = open(path, 'rb')
+    for block in iter(lambda: fp.read(1024 * 1024), b''):
+        h.update(block)
+    fp.close()
+
+    return h.hexdigest()
+
+#
+# The completed stages of one load, see the Notes above
+#
+class LoadCheckpoint:
+
+    def __init__(self, loadConfig, vocabulary):
+        self.checkpointFile = loadConfig.checkpointFile
+        self.run = {
+            'files' : dict([(f, hashFile('%s/%s' % (loadConfig.downloadDir, f))) for f in loadConfig.inputFileNames]),
+            'predicates' : loadConfig.predicatesToLoad,
+            'loadMode' : loadConfig.loadMode,
+            'vocabulary' : vocabulary,
+            }
+        # [{'stage' : name, 'artifacts' : {path : sha256, ...}, 'info' : {...}}, ...]
+        self.stages = []
+        self.read()
+
+    #
+    # Purpose: read the stages an earlier run of this load completed
+    # Returns: Nothing
+    # Assumes: Nothing
+    # Effects: reads the checkpoint and the files of its stages
+    # Throws: Nothing
+    #
+    def read(self):
+        try:
+            fp = open(self.checkpointFile, 'r')
+            last = json.load(fp)
+            fp.close()
+        except (IOError, ValueError):
+            return
+
+        if last.get('run') != self.run:
+            print('checkpoint %s is of other inputs, running every stage' % self.checkpointFile)
+            return
+
+        for stage in last['stages']:
+            if not unchanged(stage['artifacts']):
+                print('checkpoint: the files of %s changed, running it again' % stage['stage'])
+                break
+            self.stages.append(stage)
+
+        if self.stages:
+            print('checkpoint: resuming after %s' % ', '.join([s['stage'] for s in self.stages]))
+
+    def isComplete(self, name):
+        return name in [s['stage'] for s in self.stages]
+
+    def info(self, name):
+        for stage in self.stages:
+            if stage['stage'] == name:
+                return stage['info']
+        return {}
+
+    #
+    # Purpose: record a completed stage, replacing it and the stages after
+    #	it if it was run again
+    # Returns: Nothing
+    # Assumes: the artifacts are closed
+    # Effects: reads the artifacts, replaces the checkpoint
+    # Throws: Nothing
+    #
+    def complete(self, name, artifacts=(), **info):
+        names = [s['stage'] for s in self.stages]
+        if name in names:
+            del self.stages[names.index(name):]
+
+        self.stages.append({'stage' : name,
+            'artifacts' : dict([(path, hashFile(path)) for path in artifacts]),
+            'info' : info})
+        self.write()
+
+    def write(self):
+        tmpFile = '%s.%s' % (self.checkpointFile, os.getpid())
+        try:
+            fp = open(tmpFile, 'w')
+            json.dump({'run' : self.run, 'stages' : self.stages}, fp, indent=1, sort_keys=True)
+            fp.close()
+            os.replace(tmpFile, self.checkpointFile)
+        except (IOError, OSError) as e:
+            # a load that cannot be resumed is still loaded
+            print('Cannot write checkpoint %s: %s' % (self.checkpointFile, e))
+
+#
+# Purpose: check that the files a stage wrote are as it left them
+# Returns: 1 if every file exists with the recorded sha256, else 0
+# Assumes: Nothing
+# Effects: reads the files
+# Throws: Nothing
+#
+def unchanged(artifacts):
+
+    for path, digest in artifacts.items():
+        try:
+            if hashFile(path) != digest:
+                return 0
+        except IOError:
+            return 0
+
+    return 1
+
+#
+# Purpose: forget the stages once the whole load succeeded
+# Returns: Nothing
+# Assumes: Nothing
+# Effects: removes the checkpoint, if LOAD_CHECKPOINT is set and it exists
+# Throws: Nothing
+#
+def discard(checkpointFile):
+
+    if checkpointFile and os.path.exists(checkpointFile):
+        os.remove(checkpointFile)
@@ -0,0 +1,117 @@
+#
+#  loadconfig.py
+###########################################################################
+#
+#  Purpose:
+#
+#      The settings of the MP/HP mapping load, read from the environment
+#      set up by mp_hpmappingload.config or given explicitly when
+#      preprocess.py and process.py are used as a library
+#
+#  Usage:
+#
+#      config = loadconfig.LoadConfig()
+#      config = loadconfig.LoadConfig({'DOWNLOAD_DIR' : ..., ...})
+#      config = loadconfig.LoadConfig(parseWorkers=4, loadMode='delta')
+#
+#  Env Vars:
+#	See the configuration file (mp_hpmappingload.config)
+#
+#  Notes:
+#
+#      Nothing is read until a LoadConfig is created, so the load's
+#      modules can be imported without the load's environment
+#
+###########################################################################
+
+import os
+
+#
+# The settings of one run of the load
+#
+class LoadConfig:
+
+    def __init__(self, environ=None, **overrides):
+        if environ is None:
+            environ = os.environ
+        get = environ.get
+
+        # input files
+        self.downloadDir = get('DOWNLOAD_DIR')
+        self.inputFileNames = str.split(get('INPUT_FILE_NAMES', ''))
+        self.predicatesToLoad = str.split(get('PREDICATES_TO_LOAD', ''), ', ')
+        # set by mp_hpmappingload.sh when a delta load is of just the input
+        # files that changed, empty otherwise; see process.loadExisting()
+        self.deltaFileNames = str.split(get('DELTA_FILE_NAMES', ''))
+
+        # preprocessor
+        self.inputFileToLoad = get('INPUT_FILE_TOLOAD')
+        self.logDiag = get('LOG_DIAG')
+        self.logCur = get('LOG_CUR')
+        self.logCurJson = get('LOG_CUR_JSON')
+        self.parseWorkers = int(get('PARSE_WORKERS', '1'))
+        # 'row' QCs the input files one record at a time, 'columnar' a whole
+        # file at a time with numpy, see preprocess.MappingValidator
+        self.validationEngine = get('VALIDATION_ENGINE', 'row')
+        self.lookupMode = get('LOOKUP_MODE', 'full')
+        self.lookupBatchSize = int(get('LOOKUP_BATCH_SIZE', '1000'))
+        self.concurrentStartup = get('CONCURRENT_STARTUP') == 'true'
+        self.lookupCacheFile = get('LOOKUP_CACHE')
+        self.useLookupCache = get('USE_LOOKUP_CACHE') == 'true' and bool(self.lookupCacheFile)
+        # the fused load writes INPUT_FILE_TOLOAD only if this is true
+        self.writeIntermediateFile = get('WRITE_INTERMEDIATE_FILE') == 'true'
+        # the manifest of the last successful load, see manifest.py
+        self.loadManifest = get('LOAD_MANIFEST')
+
+        # load
+        self.outputDir = get('OUTPUTDIR')
+        self.relBcpFile = get('RELATIONSHIP_BCP')
+        self.propBcpFile = get('PROPERTY_BCP')
+        # 'full' deletes all of this load's relationships and bcps in every record.
+        # 'delta' compares the intermediate file with the relationships already
+        # loaded and only deletes removed, inserts new and updates changed ones.
+        # 'swap' bcps every record into unlogged staging tables and replaces this
+        # load's relationships with them in one transaction
+        self.loadMode = get('LOAD_MODE', 'full')
+        # a full load deletes its relationships this many at a time, committing
+        # after each batch; 0 deletes them all in one statement
+        self.deleteBatchSize = int(get('DELETE_BATCH_SIZE', '0'))
+        # if true, bcp files will not be bcp-ed into the database
+        self.debug = get('LOG_DEBUG') == 'true'
+        # 'bcp' writes bcp files to OUTPUTDIR and loads them with bcpin.csh
+        # 'copy' streams the rows into the database with COPY FROM STDIN, 
+        # copyBatchSize rows at a time, no bcp files are written
+        self.loadEngine = get('LOAD_ENGINE', 'bcp')
+        self.copyBatchSize = int(get('COPY_BATCH_SIZE', '50000'))
+        # if true the completed stages are recorded in checkpointFile and a
+        # rerun resumes from the first stage that did not complete, see
+        # loadcheckpoint.py
+        self.resumeLoad = get('RESUME_LOAD') == 'true'
+        self.checkpointFile = get('LOAD_CHECKPOINT')
+
+        # metrics and profiles, see loadmetrics.py
+        self.logMetrics = get('LOG_METRICS')
+        self.profileStages = str.split(get('PROFILE_STAGES', ''))
+        self.profileDir = get('PROFILE_DIR') or get('LOGDIR') or '.'
+
+        # database
+        self.pgDbUtils = get('PG_DBUTILS')
+        self.server = get('MGD_DBSERVER')
+        self.database = get('MGD_DBNAME')
+        self.user = get('MGD_DBUSER')
+        self.passwordFile = get('MGD_DBPASSWORDFILE')
+
+        for name in overrides:
+            if not hasattr(self, name):
+                raise AttributeError('Unknown load setting: %s' % name)
+            setattr(self, name, overrides[name])
+
+    #
+    # Purpose: list the settings the load cannot run without that are not set
+    # Returns: list of setting names, empty if all are set
+    # Assumes: Nothing
+    # Effects: Nothing
+    # Throws: Nothing
+    #
+    def missing(self, names):
+        return [name for name in names if getattr(self, name) is None]
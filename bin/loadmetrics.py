@@ -0,0 +1,260 @@
+#
+#  loadmetrics.py
+###########################################################################
+#
+#  Purpose:
+#
+#      Stage and input file timings shared by preprocess.py and process.py
+#
+#  Usage:
+#
+#      metrics = loadmetrics.LoadMetrics('process', config)
+#
+#      with metrics.stage('process') as stage:
+#          ...
+#          stage.rows = relationshipCt
+#
+#      metrics.write()
+#
+#  Env Vars:
+#	Read through the loadconfig.LoadConfig given to LoadMetrics:
+#	LOG_DIAG - the summary is appended to the diagnostic log
+#	LOG_METRICS - the metrics file, default mp_hpmappingload.metrics.json
+#	    in the directory of LOG_DIAG
+#	PROFILE_STAGES - stages to profile, 'all' or a list of stage names
+#	    (initialize_process for 'initialize process'), blank profiles none
+#	PROFILE_DIR - where the profiles are written, default LOGDIR
+#
+#  Outputs:
+#
+#      One JSON object per run of a script appended to LOG_METRICS:
+#	{"script": ..., "start": ..., "seconds": ...,
+#	 "stages": [{"stage", "seconds", "rows", "rowsPerSecond"}, ...],
+#	 "files": [{"file", "seconds", "rows", "rowsPerSecond", "counts"}, ...]}
+#
+#      For each profiled stage, in PROFILE_DIR:
+#	script.stage.pstats - the cProfile statistics, read with pstats
+#	script.stage.alloc.txt - the memory allocated by the stage and not
+#	    freed by its end, by source line, largest first (tracemalloc)
+#
+#  Notes:
+#
+#      Durations are measured with the monotonic clock; a stage still
+#      prints the wall clock timestamp the scripts have always printed
+#
+#      A stage inside a profiled stage (writeQcReports in parseInputFiles)
+#      is part of its profile and gets none of its own. The parse worker
+#      processes (PARSE_WORKERS > 1) are not profiled
+#
+###########################################################################
+
+import os
+import json
+import time
+import cProfile
+import tracemalloc
+
+CRT = '\n'
+
+# number of source lines in an allocation report
+topAllocations = 25
+
+#
+# Profiles one stage with cProfile and tracemalloc, see StageTimer
+#
+class StageProfiler:
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.fileBase = os.path.join(metrics.profileDir, '%s.%s' % (metrics.script, str.replace(name, ' ', '_')))
+        self.profiler = None
+        self.startedTracing = 0
+        self.snapshot = None
+
+    # a stage inside a profiled stage is part of its profile
+    def start(self):
+        if self.metrics.profiling:
+            return
+        self.metrics.profiling = 1
+
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.startedTracing = 1
+        tracemalloc.reset_peak()
+        self.snapshot = tracemalloc.take_snapshot()
+
+        self.profiler = cProfile.Profile()
+        self.profiler.enable()
+
+    #
+    # Purpose: stop profiling and write the stage's pstats and allocation
+    #	report
+    # Returns: Nothing
+    # Assumes: start() was called
+    # Effects: writes to the file system
+    # Throws: Nothing
+    #
+    def stop(self):
+        if self.profiler is None:
+            return
+        self.profiler.disable()
+        self.metrics.profiling = 0
+
+        snapshot = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        if self.startedTracing:
+            tracemalloc.stop()
+
+        try:
+            self.profiler.dump_stats(self.fileBase + '.pstats')
+            print('profile: %s.pstats' % self.fileBase)
+
+            snapshot = snapshot.filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)])
+            lines = ['peak traced memory: %.1f MB' % (peak / 1048576.0)]
+            for stat in snapshot.compare_to(self.snapshot, 'lineno')[:topAllocations]:
+                lines.append(str(stat))
+            fp = open(self.fileBase + '.alloc.txt', 'w')
+            fp.write(CRT.join(lines) + CRT)
+            fp.close()
+            print('profile: %s.alloc.txt' % self.fileBase)
+        except IOError as e:
+            print('Cannot write profile: %s' % e)
+
+#
+# Times one stage, see LoadMetrics.stage()
+#
+class StageTimer:
+
+    def __init__(self, metrics, name, rows=None, profiler=None):
+        self.metrics = metrics
+        self.name = name
+        self.rows = rows
+        self.profiler = profiler
+        self.start = None
+
+    def __enter__(self):
+        print('%s: %s' % (self.name, time.strftime("%H.%M.%S.%m.%d.%y", time.localtime(time.time()))))
+        if self.profiler:
+            self.profiler.start()
+        self.start = time.monotonic()
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        seconds = time.monotonic() - self.start
+        if self.profiler:
+            self.profiler.stop()
+        self.metrics.addStage(self.name, seconds, self.rows, excType is None)
+        return False
+
+#
+# The timings of one run of a script
+#
+class LoadMetrics:
+
+    def __init__(self, script, loadConfig):
+        self.script = script
+        self.startTime = time.time()
+        self.start = time.monotonic()
+        self.stages = []
+        self.files = []
+        self.profileStages = loadConfig.profileStages
+        self.profileDir = loadConfig.profileDir
+        self.logDiagFile = loadConfig.logDiag
+        self.metricsFile = loadConfig.logMetrics or \
+            os.path.join(os.path.dirname(loadConfig.logDiag or '.'), 'mp_hpmappingload.metrics.json')
+        # 1 while a stage's cProfile profiler is running
+        self.profiling = 0
+
+    #
+    # Purpose: time a with block as a stage, and profile it if it is in
+    #	PROFILE_STAGES
+    # Returns: a StageTimer, set its rows attribute to the rows handled
+    # Assumes: Nothing
+    # Effects: prints the stage name and the time
+    # Throws: Nothing
+    #
+    def stage(self, name, rows=None):
+        profiler = None
+        # stage names are listed with their blanks as underscores
+        if self.profileStages and ('all' in self.profileStages or str.replace(name, ' ', '_') in self.profileStages):
+            profiler = StageProfiler(self, name)
+        return StageTimer(self, name, rows, profiler)
+
+    def addStage(self, name, seconds, rows=None, completed=True):
+        entry = {'stage' : name, 'seconds' : round(seconds, 6), 'rows' : rows,
+            'rowsPerSecond' : rate(rows, seconds)}
+        if not completed:
+            entry['failed'] = True
+        self.stages.append(entry)
+
+    #
+    # Purpose: record the time spent on one input file
+    # Returns: the entry
+    # Assumes: Nothing
+    # Effects: Nothing
+    # Throws: Nothing
+    #
+    def addFile(self, fileName, seconds, rows, counts=None):
+        entry = {'file' : fileName, 'seconds' : round(seconds, 6), 'rows' : rows,
+            'rowsPerSecond' : rate(rows, seconds), 'counts' : counts or {}}
+        self.files.append(entry)
+        return entry
+
+    def asDict(self):
+        return {'script' : self.script,
+            'start' : time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self.startTime)),
+            'seconds' : round(time.monotonic() - self.start, 6),
+            'stages' : self.stages,
+            'files' : self.files}
+
+    #
+    # Purpose: render the metrics as a table for the diagnostic log
+    # Returns: the text
+    # Assumes: Nothing
+    # Effects: Nothing
+    # Throws: Nothing
+    #
+    def renderSummary(self):
+        metrics = self.asDict()
+        lines = ['%s%s metrics, %.3f seconds' % (CRT, self.script, metrics['seconds']),
+            '%-30s %12s %12s %14s' % ('stage/file', 'seconds', 'rows', 'rows/second')]
+        for entry in self.stages:
+            lines.append(formatRow(entry['stage'] + (' (failed)' if entry.get('failed') else ''), entry))
+        for entry in self.files:
+            lines.append(formatRow('  %s' % entry['file'], entry))
+
+        return CRT.join(lines) + CRT
+
+    #
+    # Purpose: append the metrics to LOG_METRICS and the summary to LOG_DIAG
+    # Returns: 0, 1 if a file cannot be written
+    # Assumes: Nothing
+    # Effects: writes to the file system
+    # Throws: Nothing
+    #
+    def write(self):
+        try:
+            fp = open(self.metricsFile, 'a')
+            fp.write(json.dumps(self.asDict(), sort_keys=True) + CRT)
+            fp.close()
+
+            if self.logDiagFile:
+                fp = open(self.logDiagFile, 'a')
+                fp.write(self.renderSummary())
+                fp.close()
+        except IOError as e:
+            print('Cannot write metrics: %s' % e)
+            return 1
+
+        return 0
+
+def rate(rows, seconds):
+    if rows is None or seconds <= 0:
+        return None
+    return round(rows / seconds, 1)
+
+def formatRow(label, entry):
+    rows = entry['rows']
+    perSecond = entry['rowsPerSecond']
+    return '%-30s %12.3f %12s %14s' % (label, entry['seconds'],
+        '' if rows is None else rows, '' if perSecond is None else '%.0f' % perSecond)
@@ -0,0 +1,186 @@
+#
+#  manifest.py
+###########################################################################
+#
+#  Purpose:
+#
+#      Decide whether anything the load depends on has changed since the
+#      last successful load, so the nightly job can skip a load that
+#      would delete and reload the same relationships
+#
+#  Usage:
+#      manifest.py check
+#      manifest.py write
+#
+#  Env Vars:
+#	See the configuration file (mp_hpmappingload.config)
+#	LOAD_MANIFEST - manifest of the last successful load
+#
+#  Inputs:
+#     The set of files specified by INPUT_FILE_NAMES and found in
+#       DOWNLOAD_DIR, PREDICATES_TO_LOAD, the MP/HP vocabulary signature
+#       (see preprocess.getLookupSignature())
+#
+#  Outputs:
+#
+#   check: writes the manifest of the current inputs to LOAD_MANIFEST.pending
+#	and prints the names of the input files to load
+#   write: replaces LOAD_MANIFEST with LOAD_MANIFEST.pending, run after
+#	the load succeeds
+#
+#  Manifest format (JSON):
+#   {"files": {fileName: sha256, ...}, "predicates": PREDICATES_TO_LOAD,
+#    "vocabulary": vocabulary signature}
+#
+#  Exit Codes:
+#      0:  check: nothing changed; write: manifest written
+#      1:  An exception occurred
+#      2:  check: something changed, the files to load are printed;
+#	   all of them unless only some input files changed
+#
+#  Notes:
+#
+###########################################################################
+
+import sys
+import os
+import json
+
+import db
+import loadconfig
+import loadcheckpoint
+import preprocess
+
+USAGE = 'Usage: manifest.py check|write'
+
+# the load's settings, see loadconfig.py, the manifest of the last 
+# successful load and the pending one; set by initialize()
+config = None
+manifestFile = None
+pendingFile = None
+
+#
+# Purpose: read the configuration, the environment unless loadConfig is given
+# Returns: 0, 1 if LOAD_MANIFEST is not set
+# Assumes: Nothing
+# Effects: sets global variables
+# Throws: Nothing
+#
+def initialize(loadConfig=None):
+    global config, manifestFile, pendingFile
+
+    config = loadConfig or loadconfig.LoadConfig()
+
+    if config.loadManifest is None:
+        sys.stderr.write('Missing load settings: loadManifest\n')
+        return 1
+
+    manifestFile = config.loadManifest
+    pendingFile = '%s.pending' % manifestFile
+
+    return 0
+
+#
+# Purpose: compute the sha256 of a file
+# Returns: the hex digest
+# Assumes: Nothing
+# Effects: reads the file
+# Throws: IOError if the file cannot be read
+#
+def hashFile(fileName):
+
+    return loadcheckpoint.hashFile('%s/%s' % (config.downloadDir, fileName))
+
+#
+# Purpose: build the manifest of the current inputs
+# Returns: the manifest dictionary
+# Assumes: Nothing
+# Effects: queries the database
+# Throws: IOError if an input file cannot be read
+#
+def buildManifest():
+
+    db.useOneConnection(1)
+    manifest = {
+        'files' : dict([(f, hashFile(f)) for f in config.inputFileNames]),
+        'predicates' : ', '.join(config.predicatesToLoad),
+        'vocabulary' : preprocess.getLookupSignature(),
+        }
+    db.useOneConnection(0)
+
+    return manifest
+
+#
+# Purpose: compare the current inputs with the last successful load
+# Returns: 0 if nothing changed, else 2
+# Assumes: Nothing
+# Effects: writes the pending manifest, prints the files to load
+# Throws: Nothing
+#
+def check():
+
+    current = buildManifest()
+
+    fp = open(pendingFile, 'w')
+    json.dump(current, fp, indent=1, sort_keys=True)
+    fp.close()
+
+    try:
+        fp = open(manifestFile, 'r')
+        last = json.load(fp)
+        fp.close()
+    except (IOError, ValueError):
+        last = None
+
+    if last == current:
+        return 0
+
+    fileNames = config.inputFileNames
+
+    # only the input files changed, load just the ones that did
+    if last is not None \
+            and last['predicates'] == current['predicates'] \
+            and last['vocabulary'] == current['vocabulary'] \
+            and sorted(last['files']) == sorted(current['files']):
+        fileNames = [f for f in fileNames if last['files'][f] != current['files'][f]]
+
+    print(' '.join(fileNames))
+
+    return 2
+
+#
+# Purpose: record the inputs of a successful load
+# Returns: 0, 1 if there is no pending manifest
+# Assumes: check() was run before the load
+# Effects: replaces the manifest
+# Throws: Nothing
+#
+def write():
+
+    if not os.path.exists(pendingFile):
+        sys.stderr.write('No pending manifest: %s\n' % pendingFile)
+        return 1
+
+    os.replace(pendingFile, manifestFile)
+
+    return 0
+
+#
+#  MAIN
+#
+
+if __name__ == '__main__':
+    if len(sys.argv) != 2 or sys.argv[1] not in ('check', 'write'):
+        sys.stderr.write('%s\n' % USAGE)
+        sys.exit(1)
+
+    try:
+        if initialize() != 0:
+            sys.exit(1)
+        if sys.argv[1] == 'check':
+            sys.exit(check())
+        else:
+            sys.exit(write())
+    except Exception as e:
+        sys.stderr.write('manifest.py %s failed: %s\n' % (sys.argv[1], e))
+        sys.exit(1)
@@ -0,0 +1,87 @@
+#
+#  mappingrecord.py
+###########################################################################
+#
+#  Purpose:
+#
+#      The MP/HP mapping record passed from the preprocessor to the load,
+#      through the intermediate file or in memory (fusedload.py)
+#
+#  Notes:
+#
+#      A run has a handful of distinct predicates, justifications and file
+#      names, so they are interned: every record shares the same string
+#      objects, and process.py can render their property rows once per
+#      distinct value instead of once per record (see process.SegmentCache)
+#
+###########################################################################
+
+import sys
+
+TAB = '\t'
+CRT = '\n'
+
+#
+# One mapping that passed QC, in the column order of the intermediate file
+#
+class MappingRecord:
+    __slots__ = ('mpID', 'mpTermLabel', 'mpKey', 'hpID', 'hpTermLabel', 'hpKey',
+        'predicate', 'justification', 'fileName')
+
+    def __init__(self, mpID, mpTermLabel, mpKey, hpID, hpTermLabel, hpKey, predicate, justification, fileName):
+        self.mpID = mpID
+        self.mpTermLabel = mpTermLabel
+        self.mpKey = mpKey
+        self.hpID = hpID
+        self.hpTermLabel = hpTermLabel
+        self.hpKey = hpKey
+        self.predicate = predicate
+        self.justification = justification
+        self.fileName = fileName
+
+    # pickled as a plain tuple, records go back from parse worker processes
+    def __reduce__(self):
+        return (MappingRecord, self.fields())
+
+    def fields(self):
+        return (self.mpID, self.mpTermLabel, self.mpKey, self.hpID, self.hpTermLabel, self.hpKey,
+            self.predicate, self.justification, self.fileName)
+
+    #
+    # Purpose: format the record as a line of the intermediate file
+    # Returns: the line
+    # Assumes: Nothing
+    # Effects: Nothing
+    # Throws: Nothing
+    #
+    def format(self):
+        return '%s%s%s%s%s%s%s%s%s%s%s%s%s%s%s%s%s%s' % (self.mpID, TAB, self.mpTermLabel, TAB, self.mpKey, TAB,
+            self.hpID, TAB, self.hpTermLabel, TAB, self.hpKey, TAB, self.predicate, TAB, self.justification, TAB,
+            self.fileName, CRT)
+
+    #
+    # Purpose: the record as the load reads it back from the intermediate
+    #	file: every field a stripped string
+    # Returns: a new MappingRecord
+    # Assumes: Nothing
+    # Effects: Nothing
+    # Throws: Nothing
+    #
+    def stripped(self):
+        return MappingRecord(*[str.strip(str(t)) for t in self.fields()])
+
+#
+# Purpose: parse a line of the intermediate file
+# Returns: a MappingRecord of stripped strings, predicate, justification
+#	and file name interned
+# Assumes: Nothing
+# Effects: Nothing
+# Throws: Nothing
+#
+def parseLine(line):
+
+    mpID, mpTermLabel, mpKey, hpID, hpTermLabel, hpKey, predicate, justification, fileName = \
+        map(str.strip, str.split(line, TAB))
+
+    return MappingRecord(mpID, mpTermLabel, mpKey, hpID, hpTermLabel, hpKey,
+        sys.intern(predicate), sys.intern(justification), sys.intern(fileName))
@@ -63,18 +63,48 @@ else
     exit 1
 fi
 
+#
+# record the inputs of a successful load for SKIP_IF_UNCHANGED
+#
+
+writeManifest ()
+{
+    if [ "${SKIP_IF_UNCHANGED}" = "true" ]
+    then
+        ${PYTHON} ${MPHPMAPPINGLOAD}/bin/manifest.py write 2>> ${LOG_DIAG}
+        if [ $? -ne 0 ]
+        then
+            echo "manifest.py write failed, the next run will not be skipped" | tee -a ${LOG_DIAG}
+        fi
+    fi
+}
+
 #
 # loop over in INPUT_FILE_NAMES in DOWNLOAD_DIR
-# checking that they exist and copying them to INPUTDIR 
+# checking that they exist and recording them in INPUTDIR 
 # if any are missing, abort the load
 #
+# the preprocessor reads the files in DOWNLOAD_DIR, INPUTDIR only keeps
+# the files loaded for the archive: a hard link to each (INPUT_ARCHIVE=link,
+# falls back to a copy across file systems), a copy (copy) or nothing (none)
+#
 
 for file in ${INPUT_FILE_NAMES}
 do
     echo "${DOWNLOAD_DIR}/${file}"
     if [ -f ${DOWNLOAD_DIR}/${file} ]
     then
-        cp ${DOWNLOAD_DIR}/${file} ${INPUTDIR}
+        case "${INPUT_ARCHIVE}" in
+        none)
+            ;;
+        copy)
+            cp ${DOWNLOAD_DIR}/${file} ${INPUTDIR}
+            ;;
+        *)
+            rm -f ${INPUTDIR}/${file}
+            ln ${DOWNLOAD_DIR}/${file} ${INPUTDIR}/${file} 2> /dev/null || cp ${DOWNLOAD_DIR}/${file} ${INPUTDIR}
+            ;;
+        esac
     else
         STAT=1
         checkStatus ${STAT} "Missing file aborting the load: ${DOWNLOAD_DIR}/${file}"
@@ -88,11 +118,72 @@ done
 
 preload ${OUTPUTDIR}
 
+#
+# skip the load if the input files, PREDICATES_TO_LOAD and the MP/HP
+# vocabularies are the same as at the last successful load
+# in delta mode load only the input files that changed
+#
+
+if [ "${SKIP_IF_UNCHANGED}" = "true" ]
+then
+    echo "" >> ${LOG_DIAG}
+    date >> ${LOG_DIAG}
+    echo "Run manifest.py check"  | tee -a ${LOG_DIAG}
+    CHANGED_FILE_NAMES=`${PYTHON} ${MPHPMAPPINGLOAD}/bin/manifest.py check 2>> ${LOG_DIAG}`
+    STAT=$?
+    if [ ${STAT} -eq 0 ]
+    then
+        echo "Inputs unchanged since the last load, skipping the load" | tee -a ${LOG_DIAG}
+
+        # run postload cleanup and email logs
+        shutDown
+        exit 0
+    elif [ ${STAT} -eq 2 ]
+    then
+        # only some of the input files changed: DELTA_FILE_NAMES tells
+        # process.py to keep the relationships of the other files
+        if [ "${LOAD_MODE}" = "delta" -a "${CHANGED_FILE_NAMES}" != "`echo ${INPUT_FILE_NAMES}`" ]
+        then
+            INPUT_FILE_NAMES="${CHANGED_FILE_NAMES}"
+            DELTA_FILE_NAMES="${CHANGED_FILE_NAMES}"
+            export INPUT_FILE_NAMES DELTA_FILE_NAMES
+        fi
+        echo "Loading: ${INPUT_FILE_NAMES}" | tee -a ${LOG_DIAG}
+    else
+        echo "manifest.py check failed, running the full load" | tee -a ${LOG_DIAG}
+    fi
+fi
+
 #
 # rm all files/dirs from OUTPUTDIR
+# unless they are the outputs of an interrupted load to resume (RESUME_LOAD)
 #
 
-cleanDir ${OUTPUTDIR}
+if [ "${RESUME_LOAD}" = "true" -a -f "${LOAD_CHECKPOINT}" ]
+then
+    echo "Resuming the load from ${LOAD_CHECKPOINT}" | tee -a ${LOG_DIAG}
+else
+    cleanDir ${OUTPUTDIR}
+fi
+
+if [ "${FUSED_LOAD}" = "true" ]
+then
+    #
+    # run the preprocessor and the load in one process
+    #
+    echo "" >> ${LOG_DIAG}
+    date >> ${LOG_DIAG}
+    echo "Run fusedload.py"  | tee -a ${LOG_DIAG}
+    ${PYTHON} ${MPHPMAPPINGLOAD}/bin/fusedload.py
+    STAT=$?
+    checkStatus ${STAT} "${MPHPMAPPINGLOAD}/bin/fusedload.py"
+
+    writeManifest
+
+    # run postload cleanup and email logs
+    shutDown
+    exit 0
+fi
 
 echo "" >> ${LOG_DIAG}
 date >> ${LOG_DIAG}
@@ -117,6 +208,8 @@ ${PYTHON} ${MPHPMAPPINGLOAD}/bin/process.py
 STAT=$?
 checkStatus ${STAT} "${MPHPMAPPINGLOAD}/bin/process.py"
 
+writeManifest
+
 # run postload cleanup and email logs
 
 shutDown
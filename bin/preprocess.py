@@ -9,12 +9,19 @@
 #  Usage:
 #      preprocess.py
 #
+#      or as a library, nothing is read or opened on import:
+#	config = loadconfig.LoadConfig(...)
+#	lookups = preprocess.TermLookups()
+#	preprocess.loadLookups(config, lookups)
+#	validator = preprocess.MappingValidator(config, lookups)
+#	validator.parseFile(fileName, set(), preprocess.QcEventSink(), records.append)
+#
 #  Env Vars:
 #	See the configuration file (mp_hpmappingload.config)
 #
 #  Inputs:
 #     The set of files specified by INPUT_FILE_NAMES and found in
-#       DOWNLOAD_DIR
+#       DOWNLOAD_DIR, plain or compressed (.gz, .bz2)
 #
 #  Outputs:
 #
@@ -38,6 +45,10 @@
 #	3) parse input files to create intermediate file, do QC
 #	4) close input/output files
 #
+#      With RESUME_LOAD the intermediate file is recorded in LOAD_CHECKPOINT;
+#      a rerun of an interrupted load with the same inputs skips all of the
+#      steps and uses the intermediate file it finds (see loadcheckpoint.py)
+#
 #  Notes: 
 #
 #  11/18/2022	sc
@@ -48,104 +59,458 @@
 import sys 
 import os
 import string
+import operator
+import json
+import gzip
+import bz2
+import multiprocessing
+import threading
+import sqlite3
+import itertools
 import Set
 import db
+try:
+    import numpy
+except ImportError:
+    numpy = None
 import time
+import loadconfig
+import loadcheckpoint
+import loadmetrics
+import mappingrecord
 
 #db.setTrace(True)
 
 CRT = '\n'
 TAB = '\t'
 
+# the load's settings, see loadconfig.py, and the QC of the input files,
+# see MappingValidator; set by initialize()
+config = None
+validator = None
+
 # Outputs 
 inputFileInt = None
 logDiagFile = None
 logCurFile = None
+logCurJsonFile = None
 
 # file pointers
-fpInput = None # will be used over and over for each file
 fpInputInt = None
 fpLogDiag = None
 fpLogCur = None
 
+# stage and input file timings, see loadmetrics.py; created by main() or
+# initialize(), the fused load shares its own
+metrics = None
+
 # value for blank predicate and justification
 unspecified = 'unspecified'
 
-downloadDir = os.getenv('DOWNLOAD_DIR')
-predicateIncludeList = str.split(os.getenv('PREDICATES_TO_LOAD'), ', ')
+# set to 0 by the fused load, where the intermediate file is only a debug artifact
+writeIntermediateFile = 1
 
-# Lookups
-# {mpID:[key, term], ...}
-# preferred
-mpDict = {}
+# the background lookup load and the exception it raised, if any
+lookupThread = None
+lookupError = None
 
-# non-preferred
-mpNpDict = {}
+# the completed stages with RESUME_LOAD, see loadcheckpoint.py; None if
+# they are not recorded
+checkpoint = None
 
-# {hpID:[key, term], ...}
-# preferred
-hpDict = {}
+# the SSSOM columns we parse out of each input file, in the order
+# they are returned by the compiled column map
+requiredColumns = ['subject_id', 'subject_label', 'object_id', 'object_label', 'predicate_id', 'mapping_justification']
 
-# non-preferred
-hpNpDict = {}
+# raised when an input file cannot be parsed
+class InputFileError(Exception):
+    pass
 
 #
-# Purpose: Initialization  of variable with values from the environment
-#	load lookup structures from the database
-# Returns: 1 if environment variable not set
-# Assumes: Nothing
-# Effects: opens a database connection
-# Throws: Nothing
+# A term in the MP or HP lookup, one per accession ID
 #
-def initialize():
-    global inputFileInt, logDiagFile, logCurFile
-    global mpDict, mpNpDict, hpDict, hpNpDict
+class TermRecord:
+    __slots__ = ('accid', 'key', 'term', 'preferred')
 
-    inputFileInt = os.getenv('INPUT_FILE_TOLOAD')
-    logDiagFile = os.getenv('LOG_DIAG')
-    logCurFile = os.getenv('LOG_CUR')
+    def __init__(self, accid, key, term, preferred):
+        self.accid = accid
+        self.key = key
+        self.term = term
+        self.preferred = preferred
 
-    db.useOneConnection(1)
+#
+# QC event categories and their curation log text, formatted with
+# (line number,) + event payload
+#
+qcTemplates = {
+    'blankMp' : 'Line %s - MP ID is blank: %s',
+    'blankHp' : 'Line %s - HP ID is blank: %s',
+    'badMp' : 'Line %s - Invalid MP ID: %s',
+    'npMp' : 'Line %s - Non-preferred MP ID (relationship loaded): %s',
+    'hpNotFound' : 'Line %s - HP ID sssom:NoTermFound: %s',
+    'badHp' : 'Line %s - Invalid HP ID: %s',
+    'npHp' : 'Line %s - Non-preferred HP ID (relationship loaded): %s',
+    'badPred' : 'Line %s - Non-configured predicate: %s',
+    'dupe' : 'Dupe Line: %s - %s',
+    'mpBadTerm' : 'Line %s - Database MP Term: "%s" does not match input term(relationship loaded): %s',
+    'hpBadTerm' : 'Line %s - Database HP Term: "%s" does not match input term(relationship loaded): %s',
+    }
+
+# per-file totals in the curation log, (text, counts key)
+qcTotals = [
+    ('Total Records', 'record'),
+    ('Total Dupes', 'dupe'),
+    ('Total Records with Blank MP ID', 'blankMp'),
+    ('Total Records with Blank HP ID', 'blankHp'),
+    ('Total Records with Invalid MP ID', 'badMp'),
+    ('Total Records with Invalid HP ID', 'badHp'),
+    ('Total Records with Secondary MP ID (relationship loaded)', 'npMp'),
+    ('Total Records with Secondary HP ID (relationship loaded)', 'npHp'),
+    ('Total Records where input MP label does not match database term (relationship loaded)', 'mpBadTerm'),
+    ('Total Records where input HP label does not match database term (relationship loaded)', 'hpBadTerm'),
+    ('Total Records with HP sssom:NoTermFound', 'hpNotFound'),
+    ('Total Records with non-configured Predicate', 'badPred'),
+    ('Total Records written to Intermediate File', 'good'),
+    ]
 
-    # lookup of preferred MP IDs/terms
-    results = db.sql('''select a.accid, a._object_key, t.term
-        from acc_accession a, voc_term t
-        where a._mgitype_key = 13
-        and a._logicaldb_key = 34
-        and a.preferred = 1
-        and a._object_key = t._term_key''', 'auto')
-    for r in results:
-        mpDict[r['accid']] = [r['_object_key'], r['term']]
+#
+# Is: the QC events of the preprocessor, collected in memory and written
+#	in bulk once all files are parsed
+# Has: a section per input file: [fileName, [(lineNum, category, payload), ...],
+#	counts or None, error or None]
+# Does: startFile(), event(), endFile(), error(), addSection() to merge a
+#	section from a worker, renderText() - the LOG_CUR report, 
+#	writeJson() - one JSON object per event and per file summary
+#
+class QcEventSink:
+
+    def __init__(self):
+        self.sections = []
+        self.events = None
+
+    def startFile(self, fileName):
+        self.events = []
+        self.sections.append([fileName, self.events, None, None])
+
+    def event(self, lineNum, category, *payload):
+        self.events.append((lineNum, category, payload))
+
+    # events of the current file as (lineNum, category, payload) tuples
+    def addEvents(self, events):
+        self.events.extend(events)
+
+    def endFile(self, counts):
+        self.sections[-1][2] = counts
+
+    def error(self, msg):
+        self.sections[-1][3] = msg
+
+    def addSection(self, section):
+        self.sections.append(section)
+
+    def renderText(self, totalGoodCt=None):
+        text = []
+        for fileName, events, counts, error in self.sections:
+            text.append('%sFile: %s%s' % (CRT, fileName, CRT))
+            for lineNum, category, payload in events:
+                text.append(qcTemplates[category] % ((lineNum,) + payload))
+                text.append(CRT)
+            if counts is not None:
+                for label, key in qcTotals:
+                    text.append('%s: %s%s' % (label, counts[key], CRT))
+            if error is not None:
+                text.append('%s%s' % (error, CRT))
+        if totalGoodCt is not None:
+            text.append('%sTotal Records from all files written to Intermediate File: %s%s' % (CRT, totalGoodCt, CRT))
+        return ''.join(text)
+
+    def writeJson(self, fp):
+        for fileName, events, counts, error in self.sections:
+            for lineNum, category, payload in events:
+                fp.write(json.dumps({'file': fileName, 'line': lineNum, 'category': category, 'payload': payload}))
+                fp.write(CRT)
+            fp.write(json.dumps({'file': fileName, 'category': 'summary', 'counts': counts, 'error': error}))
+            fp.write(CRT)
 
-    # lookup of non-preferred MP IDs/terms
-    results = db.sql('''select a.accid, a._object_key, t.term
-        from acc_accession a, voc_term t
-        where a._mgitype_key = 13
-        and a._logicaldb_key = 34
-        and a.preferred = 0
-        and a._object_key = t._term_key''', 'auto')
-    for r in results:
-        mpNpDict[r['accid']] = [r['_object_key'], r['term']]
+#
+# Is: the MP and HP lookups the input IDs are validated against
+# Has: mp - {mpID:TermRecord, ...} logicaldb 34, preferred and non-preferred
+#	hp - {hpID:TermRecord, ...} logicaldb 180, preferred and non-preferred
+# Does: addRow() - add a row of the MP/HP lookup query, clear(), 
+#	len() - the number of IDs in both lookups
+#
+class TermLookups:
+
+    def __init__(self):
+        self.mp = {}
+        self.hp = {}
 
-    # lookup of preferred HP IDs/terms
-    results = db.sql('''select a.accid, a._object_key, t.term
+    # rows are added preferred last, so a preferred ID replaces a 
+    # non-preferred one with the same accid
+    def addRow(self, accID, logicalDBKey, preferred, key, term):
+        if logicalDBKey == 34:
+            lookup = self.mp
+        else:
+            lookup = self.hp
+        accID = sys.intern(accID)
+        lookup[accID] = TermRecord(accID, key, sys.intern(term), preferred)
+
+    def clear(self):
+        self.mp.clear()
+        self.hp.clear()
+
+    def __len__(self):
+        return len(self.mp) + len(self.hp)
+
+# the lookups of this run, loaded by initialize()
+lookups = TermLookups()
+
+#
+# Purpose: cheap probe of the database state the lookups are built from
+# Returns: signature string that changes when any MP/HP accession or term
+#	is added, deleted or modified
+# Assumes: database connection
+# Effects: queries the database
+# Throws: Nothing
+#
+def getLookupSignature():
+
+    results = db.sql('''select a._logicaldb_key, count(*) as rowCt,
+            max(a.modification_date) as accDate, max(t.modification_date) as termDate
         from acc_accession a, voc_term t
         where a._mgitype_key = 13
-        and a._logicaldb_key = 180
-        --and a.preferred = 1
-        and a._object_key = t._term_key''', 'auto')
-    for r in results:
-        hpDict[r['accid']] = [r['_object_key'], r['term']]
+        and a._logicaldb_key in (34, 180)
+        and a._object_key = t._term_key
+        group by a._logicaldb_key
+        order by a._logicaldb_key''', 'auto')
+
+    return '|'.join(['%s:%s:%s:%s' % (r['_logicaldb_key'], r['rowCt'], r['accDate'], r['termDate']) for r in results])
+
+#
+# Purpose: load the lookups from the on-disk cache
+# Returns: 1 if the cache exists and matches signature, else 0
+# Assumes: Nothing
+# Effects: updates termLookups
+# Throws: Nothing
+#
+def loadLookupCache(termLookups, lookupCacheFile, signature):
+
+    if not os.path.exists(lookupCacheFile):
+        return 0
+
+    try:
+        conn = sqlite3.connect(lookupCacheFile)
+        try:
+            row = conn.execute('select signature from meta').fetchone()
+            if row is None or row[0] != signature:
+                return 0
+            for r in conn.execute('select accid, logicaldb, preferred, objectkey, term from term order by rowid'):
+                termLookups.addRow(*r)
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        print('Cannot read lookup cache %s: %s' % (lookupCacheFile, e))
+        termLookups.clear()
+        return 0
+
+    return 1
+
+#
+# Purpose: write the lookup query results to the on-disk cache
+# Returns: Nothing
+# Assumes: results are ordered preferred last
+# Effects: replaces lookupCacheFile
+# Throws: Nothing
+#
+def writeLookupCache(lookupCacheFile, signature, results):
+
+    tmpFile = '%s.%s' % (lookupCacheFile, os.getpid())
+    try:
+        if os.path.exists(tmpFile):
+            os.remove(tmpFile)
+        conn = sqlite3.connect(tmpFile)
+        conn.execute('create table meta (signature text)')
+        conn.execute('create table term (accid text, logicaldb integer, preferred integer, objectkey integer, term text)')
+        conn.execute('insert into meta values (?)', (signature,))
+        conn.executemany('insert into term values (?, ?, ?, ?, ?)', \
+            [(r['accid'], r['_logicaldb_key'], r['preferred'], r['_object_key'], r['term']) for r in results])
+        conn.commit()
+        conn.close()
+        os.replace(tmpFile, lookupCacheFile)
+    except (sqlite3.Error, OSError) as e:
+        # the cache is an optimization, the load does not depend on it
+        print('Cannot write lookup cache %s: %s' % (lookupCacheFile, e))
+
+#
+# Purpose: collect the distinct MP and HP IDs of the input files
+# Returns: set of IDs, subject_id and object_id values alike
+# Assumes: Nothing
+# Effects: reads the input files
+# Throws: IOError if an input file cannot be opened
+# Notes: a file that cannot be parsed is scanned up to the error, 
+#	parseInputFiles() reports it
+#
+def scanInputIDs(loadConfig):
+
+    accIDs = set()
+
+    for fileName in loadConfig.inputFileNames:
+        fp = openInputFile(loadConfig.downloadDir, fileName)
+        try:
+            for lineNum, line, fields in tokenizeLines(fileName, readLines(fp)):
+                accIDs.add(fields[0])
+                accIDs.add(fields[2])
+        except InputFileError:
+            pass
+        finally:
+            fp.close()
+
+    accIDs.discard('')
+
+    return accIDs
 
-    # lookup of non-preferred HP IDs/terms
-    results = db.sql('''select a.accid, a._object_key, t.term
+#
+# Purpose: load the lookup rows of the given IDs only
+# Returns: Nothing
+# Assumes: database connection
+# Effects: queries the database, updates termLookups
+# Throws: Nothing
+# Notes: termLookups holds the same rows for these IDs as the full
+#	lookups, so every ID is classified as it would be by them. 
+#	An ID is in one batch only, so sorting each batch on preferred 
+#	still adds the preferred row of an ID last
+#
+def loadTargetedLookups(termLookups, accIDs, batchSize):
+
+    accIDs = sorted(accIDs)
+
+    for i in range(0, len(accIDs), batchSize):
+        inList = ', '.join(["'%s'" % str.replace(a, "'", "''") for a in accIDs[i:i + batchSize]])
+        results = db.sql('''select a.accid, a._logicaldb_key, a.preferred, a._object_key, t.term
+            from acc_accession a, voc_term t
+            where a._mgitype_key = 13
+            and a._logicaldb_key in (34, 180)
+            and a.accid in (%s)
+            and a._object_key = t._term_key
+            order by a.preferred''' % inList, 'auto')
+        for r in results:
+            termLookups.addRow(r['accid'], r['_logicaldb_key'], r['preferred'], r['_object_key'], r['term'])
+
+#
+# Purpose: load the MP/HP lookups: the input IDs only (LOOKUP_MODE=targeted),
+#	from the lookup cache, or the whole vocabulary from the database
+# Returns: Nothing
+# Assumes: database connection
+# Effects: queries the database, updates termLookups
+# Throws: Nothing
+#
+def loadLookups(loadConfig, termLookups):
+
+    # the lookup cache holds the whole vocabulary, it is not used here
+    if loadConfig.lookupMode == 'targeted':
+        accIDs = scanInputIDs(loadConfig)
+        loadTargetedLookups(termLookups, accIDs, loadConfig.lookupBatchSize)
+        print('lookups loaded for %s input IDs' % len(accIDs))
+        return
+
+    if loadConfig.useLookupCache:
+        signature = getLookupSignature()
+        if loadLookupCache(termLookups, loadConfig.lookupCacheFile, signature):
+            print('lookups loaded from cache: %s' % loadConfig.lookupCacheFile)
+            return
+
+    # lookup of MP and HP IDs/terms, preferred and non-preferred.
+    # Sorted so that a preferred ID replaces a non-preferred one with the same accid
+    results = db.sql('''select a.accid, a._logicaldb_key, a.preferred, a._object_key, t.term
         from acc_accession a, voc_term t
         where a._mgitype_key = 13
-        and a._logicaldb_key = 180
-        --and a.preferred = 0
-        and a._object_key = t._term_key''', 'auto')
+        and a._logicaldb_key in (34, 180)
+        and a._object_key = t._term_key
+        order by a.preferred''', 'auto')
     for r in results:
-        hpNpDict[r['accid']] = [r['_object_key'], r['term']]
+        termLookups.addRow(r['accid'], r['_logicaldb_key'], r['preferred'], r['_object_key'], r['term'])
+
+    if loadConfig.useLookupCache:
+        writeLookupCache(loadConfig.lookupCacheFile, signature, results)
+
+#
+# Purpose: the body of the background lookup thread
+# Returns: Nothing
+# Assumes: the main thread does not use the database until waitForLookups()
+# Effects: see loadLookups(), sets lookupError if the load fails, adds 
+#	a loadLookups stage to the metrics
+# Throws: Nothing
+#
+def loadLookupsInBackground():
+    global lookupError
+
+    start = time.monotonic()
+    try:
+        loadLookups(config, lookups)
+    except Exception as e:
+        lookupError = e
+    metrics.addStage('loadLookups', time.monotonic() - start, len(lookups), lookupError is None)
+
+#
+# Purpose: wait for the background lookup load started by initialize()
+# Returns: 0, 1 if the lookups could not be loaded
+# Assumes: Nothing
+# Effects: Nothing
+# Throws: Nothing
+#
+def waitForLookups():
+    global lookupThread
+
+    if lookupThread is None:
+        return 0
+
+    lookupThread.join()
+    lookupThread = None
+
+    if lookupError is not None:
+        print('Cannot load lookups: %s' % lookupError)
+        return 1
+
+    return 0
+
+#
+# Purpose: Initialization  of variable with values from the configuration
+#	(the environment unless loadConfig is given), load lookup structures
+#	from the database, in a background thread if CONCURRENT_STARTUP is true
+# Returns: 0
+# Assumes: Nothing
+# Effects: opens a database connection
+# Throws: Nothing
+#
+def initialize(loadConfig=None):
+    global config, inputFileInt, logDiagFile, logCurFile, logCurJsonFile, validator, lookupThread
+    global metrics
+
+    config = loadConfig or loadconfig.LoadConfig()
+
+    if metrics is None:
+        metrics = loadmetrics.LoadMetrics('preprocess', config)
+
+    inputFileInt = config.inputFileToLoad
+    logDiagFile = config.logDiag
+    logCurFile = config.logCur
+    logCurJsonFile = config.logCurJson
+
+    if config.validationEngine == 'columnar' and numpy is None:
+        print('VALIDATION_ENGINE=columnar needs numpy, validating row by row')
+
+    validator = MappingValidator(config, lookups, metrics)
+
+    db.useOneConnection(1)
+
+    # a daemon thread, so a failed header check does not wait for the
+    # lookup queries before exiting
+    if config.concurrentStartup:
+        lookupThread = threading.Thread(target=loadLookupsInBackground, name='loadLookups', daemon=True)
+        lookupThread.start()
+        return 0
+
+    loadLookups(config, lookups)
 
     return 0
 
@@ -164,7 +529,8 @@ def openFiles():
     # Open the intermediate file
     #
     try:
-        fpInputInt = open(inputFileInt, 'w')
+        if writeIntermediateFile:
+            fpInputInt = open(inputFileInt, 'w')
     except:
         print('Cannot open file: ' + inputFileInt)
         return 1
@@ -215,240 +581,737 @@ def closeFiles():
     return 0
 
 #
-# Purpose: parse the set of input files
-# Returns: 0
-# Assumes: 
+# Purpose: resolve the header line of an input file to the positions of
+#	the requiredColumns, once per file
+# Returns: (extract, maxSplit) where extract(tokens) returns the required
+#	column values in requiredColumns order and maxSplit is the split limit
+#	that yields every required column
+# Assumes: Nothing
 # Effects: Nothing
+# Throws: InputFileError if a required column is missing
+#
+def compileColumnMap(fileName, headers):
+
+    missing = [c for c in requiredColumns if c not in headers]
+    if missing:
+        raise InputFileError('File %s is missing required column(s): %s' % (fileName, ', '.join(missing)))
+
+    positions = [headers.index(c) for c in requiredColumns]
+
+    return operator.itemgetter(*positions), max(positions) + 1
+
+#
+# Purpose: read an input file one line at a time
+# Returns: generator of (line number, line with the CRT removed)
+# Assumes: fp is open
+# Effects: reads from fp
 # Throws: Nothing
 #
-def parseInputFiles():
-    # loop through the configured files parsing out pertinent info to the intermediate file
-    
-    # parse out the columns we want:
-    # MP ID = subject_id
-    # HP ID = object_id
-    # predicate value = predicate_id (load only those in predicateIncludeList)
-    # mapping justification = mapping_justification
+def readLines(fp):
 
-    # used for checking dupes in the input
-    lineList = []
+    lineNum = 0
+    for line in fp:
+        lineNum += 1
+        # only strip the line ending, stripping any other white space
+        # would also remove the TAB of a blank first or last column
+        yield lineNum, line.rstrip('\r\n')
 
-    totalGoodCt = 0 
-    for fileName in str.split(os.getenv('INPUT_FILE_NAMES')):
-        print('fileName: %s' % fileName)
+#
+# Purpose: skip comments, compile the column map from the header line and
+#	split each data line into the required columns
+# Returns: generator of (line number, line, (mpID, mpTermLabel, hpID,
+#	hpTermLabel, predicate, mapjust))
+# Assumes: Nothing
+# Effects: Nothing
+# Throws: InputFileError if the header is missing a required column or
+#	a data line comes before the header
+#
+def tokenizeLines(fileName, lines):
+
+    # The column map compiled from the header of the current file, columns are 
+    # ordered differently in different files, but have same text
+    extract = None
+
+    for lineNum, line in lines:
+        #print('line: %s' % line)
+        if str.find(line, '#') == 0:
+            continue
+        elif str.find(line, 'subject_id') != -1:
+            #print('headers: %s' % line)
+            extract, maxSplit = compileColumnMap(fileName, str.split(line, TAB))
+            continue
+        elif extract is None:
+            raise InputFileError('File %s has no header line before line %s' % (fileName, lineNum))
+
+        # parse out the columns we want, splitting only as far as the
+        # last one we need
+        # MP ID = subject_id      
+        # HP ID = object_id
+        # predicate value = predicate_id (load only those in predicateIncludeList)
+        # mapping justification = mapping_justification       
+        yield lineNum, line, extract(str.split(line, TAB, maxSplit))
 
-        # The list of column headers for the current file, columns are ordered differently
-        # in different files, but have same text
-        headers = []
+#
+# Purpose: factorize a column
+# Returns: (distinct values in order of appearance, numpy array of each
+#	row's index into them)
+# Assumes: numpy is installed
+# Effects: Nothing
+# Throws: Nothing
+#
+def factorize(values):
 
-        fpInput = open('%s/%s' % (downloadDir, fileName))
-        fpLogCur.write('%sFile: %s%s' % (CRT, fileName, CRT))
+    index = dict.fromkeys(values)
+    distinct = list(index)
+    for code, value in enumerate(distinct):
+        index[value] = code
+    codes = numpy.fromiter(map(index.__getitem__, values), dtype=numpy.int64, count=len(values))
 
-        # number of actual records in this file, including dupes
-        recordCt = 0
+    return distinct, codes
 
-        # number of records skipped because duplicate
-        dupeCt = 0
+#
+# Purpose: a list as a numpy array of its objects, for indexing
+# Returns: 1 dimensional numpy array of dtype object
+# Assumes: numpy is installed
+# Effects: Nothing
+# Throws: Nothing
+#
+def objectColumn(values):
 
-        # number of records written to the intermediate file
-        goodCt = 0
+    column = numpy.empty(len(values), dtype=object)
+    column[:] = values
 
-        # number of records skipped because predicate not in list
-        badPredCt = 0
+    return column
 
-        # number of records skipped because MP is blank
-        blankMpCt = 0
+#
+# Purpose: open an input file in downloadDir for reading, decompressing
+#	.gz and .bz2 files as they are read
+# Returns: the text file object
+# Assumes: Nothing
+# Effects: Nothing
+# Throws: IOError if the file cannot be opened
+#
+def openInputFile(downloadDir, fileName):
 
-        # number of records skipped because HP is blank
-        blankHpCt = 0
+    path = '%s/%s' % (downloadDir, fileName)
 
-        # MP ID is not in the database 
-        badMpCt = 0
+    if fileName.endswith('.gz'):
+        return gzip.open(path, 'rt')
+    elif fileName.endswith('.bz2'):
+        return bz2.open(path, 'rt')
 
-        # HP  ID is not in the database 
-        badHpCt = 0
-      
-        # Input MP term does not match database term 
-        mpBadTermCt = 0
+    return open(path)
 
-        # Input HP term does not match database term
-        hpBadTermCt = 0
+#
+# Is: the QC of the input files against the MP/HP lookups and the
+#	configured predicates
+# Has: the lookups, the predicates to load, the directory the input files
+#	are read from, the validation engine, the stripped predicate and
+#	justification values ({'skos:exactMatch' : 'exactMatch', ...})
+# Does: parseFile() - read, tokenize and QC one input file; 
+#	validateRecords() - the QC of a file's tokenized records; 
+#	validateColumns() - the columnar QC of a whole file
+#
+class MappingValidator:
 
-        # MP ID is not a preferred ID
-        npMpCt = 0
+    # the HP lookups have never filtered on a.preferred, so every HP ID in the
+    # database is treated as preferred; set to 1 to report non-preferred HP IDs
+    reportNonPreferredHp = 0
 
-        # HP  ID is not a preferred ID
-        npHpCt = 0
+    def __init__(self, loadConfig, termLookups, loadMetrics=None):
+        self.lookups = termLookups
+        self.predicateIncludeList = loadConfig.predicatesToLoad
+        self.downloadDir = loadConfig.downloadDir
+        # validateColumns() needs numpy
+        self.columnar = loadConfig.validationEngine == 'columnar' and numpy is not None
+        self.metrics = loadMetrics
+        self.prefixFreeValues = {}
 
-        # No HP ID in the input record
-        hpNotFoundCt = 0
+    #
+    # Purpose: parse one input file
+    # Returns: number of records that pass QC
+    # Assumes: lookups have been loaded
+    # Effects: adds the file section and its events to qc, calls
+    #	emit(record) for each record that passes QC; with the columnar
+    #	engine and write given, calls write(text) with the intermediate
+    #	file lines of the records instead
+    # Throws: InputFileError if the file cannot be parsed
+    #
+    def parseFile(self, fileName, dupeSet, qc, emit, write=None):
+
+        start = time.monotonic()
+        fpInput = openInputFile(self.downloadDir, fileName)
+        qc.startFile(fileName)
+
+        # record: number of actual records in this file, including dupes
+        # dupe: number of records skipped because duplicate
+        # good: number of records written to the intermediate file
+        # badPred: number of records skipped because predicate not in list
+        # blankMp: number of records skipped because MP is blank
+        # blankHp: number of records skipped because HP is blank
+        # badMp: MP ID is not in the database 
+        # badHp: HP  ID is not in the database 
+        # mpBadTerm: Input MP term does not match database term 
+        # hpBadTerm: Input HP term does not match database term
+        # npMp: MP ID is not a preferred ID
+        # npHp: HP  ID is not a preferred ID
+        # hpNotFound: No HP ID in the input record
+        counts = dict.fromkeys(['record', 'dupe', 'good', 'badPred', 'blankMp', 'blankHp', 
+            'badMp', 'badHp', 'mpBadTerm', 'hpBadTerm', 'npMp', 'npHp', 'hpNotFound'], 0)
+
+        try:
+            if self.columnar and write is not None:
+                counts['good'] += self.validateColumns(fileName, fpInput, counts, dupeSet, qc, write)
+            else:
+                records = tokenizeLines(fileName, readLines(fpInput))
+                for record in self.validateRecords(fileName, records, counts, dupeSet, qc):
+                    emit(record)
+                    counts['good'] += 1    
+        finally:
+            fpInput.close()
 
-        # current line number in current file
-        lineNum = 0
-        for line in fpInput.readlines():
-            lineNum += 1
-            # set to false if a non-preferred ID, which we will report and load.
-            mpPreferred = 1
-            hpPreferred = 1
-            line = str.strip(line) # remove CRT at end of line
-            #print('line: %s' % line)
-            if str.find(line, '#') == 0:
-                continue
-            elif str.find(line, 'subject_id') != -1:
-                headers = str.split(line, TAB)
-                #print('headers: %s' % headers)
-                continue
-            recordCt +=1
-
-            tokens = str.split(line, TAB)
-            # parse out the columns we want
-            # MP ID = subject_id      
-            # HP ID = object_id
-            # predicate value = predicate_id (load only those in predicateIncludeList)
-            # mapping justification = mapping_justification       
-            mpID = tokens[headers.index('subject_id')]
-            mpTermLabel =  tokens[headers.index('subject_label')]
-            hpID = tokens[headers.index('object_id')]
-            hpTermLabel =  tokens[headers.index('object_label')]
+        qc.endFile(counts)
+        if self.metrics:
+            self.metrics.addFile(fileName, time.monotonic() - start, counts['record'], dict(counts))
+
+        return counts['good']
+
+    #
+    # Purpose: QC the tokenized records of an input file against the lookups,
+    #	the configured predicates and the records already accepted
+    # Returns: generator of a mappingrecord.MappingRecord for each record to load;
+    #	IDs, matching labels, predicates and justifications are shared with
+    #	the lookups and the other records
+    # Assumes: lookups have been loaded
+    # Effects: adds events to qc, updates counts and dupeSet
+    # Throws: Nothing
+    #
+    def validateRecords(self, fileName, records, counts, dupeSet, qc):
+
+        mpLookup = self.lookups.mp
+        hpLookup = self.lookups.hp
+        predicateIncludeList = self.predicateIncludeList
+        reportNonPreferredHp = self.reportNonPreferredHp
+        stripPrefix = self.stripPrefix
+
+        for lineNum, line, fields in records:
+            mpID, mpTermLabel, hpID, hpTermLabel, predicate, mapjust = fields
+            counts['record'] += 1
 
             if mpID == '':
-                fpLogCur.write('Line %s - MP ID is blank: %s' % (lineNum, line, CRT))
-                blankMpCt += 1
+                qc.event(lineNum, 'blankMp', line)
+                counts['blankMp'] += 1
                 continue
 
             if hpID == '':
-                fpLogCur.write('Line %s - HP ID is blank: %s' % (lineNum, line, CRT))
-                blankHpCt += 1
+                qc.event(lineNum, 'blankHp', line)
+                counts['blankHp'] += 1
                 continue
 
-            if mpID not in mpDict:
-                if mpID not in mpNpDict:
-                    badMpCt += 1
-                    fpLogCur.write('Line %s - Invalid MP ID: %s%s' % (lineNum, line, CRT))
-                    continue
-                else:
-                    mpPreferred = 0
-                    fpLogCur.write('Line %s - Non-preferred MP ID (relationship loaded): %s%s' % (lineNum, line, CRT))
-                    npMpCt +=1                   
+            # non-preferred IDs are reported and loaded
+            mpRecord = mpLookup.get(mpID)
+            if mpRecord is None:
+                counts['badMp'] += 1
+                qc.event(lineNum, 'badMp', line)
+                continue
+            elif not mpRecord.preferred:
+                qc.event(lineNum, 'npMp', line)
+                counts['npMp'] += 1
 
-            if hpID not in hpDict:
+            hpRecord = hpLookup.get(hpID)
+            if hpRecord is None:
                 if hpID == 'sssom:NoTermFound':
-                    fpLogCur.write('Line %s - HP ID sssom:NoTermFound: %s%s' % (lineNum, line, CRT))
-                    hpNotFoundCt += 1
-                    continue
-                elif hpID not in hpNpDict:
-                    fpLogCur.write('Line %s - Invalid HP ID: %s%s' % (lineNum, line, CRT))
-                    badHpCt += 1
+                    qc.event(lineNum, 'hpNotFound', line)
+                    counts['hpNotFound'] += 1
                     continue
                 else:
-                    hpPreferred = 0
-                    fpLogCur.write('Line %s - Non-preferred HP ID (relationship loaded): %s%s' % (lineNum, line, CRT))       
-                    npHpCt += 1
+                    qc.event(lineNum, 'badHp', line)
+                    counts['badHp'] += 1
+                    continue
+            elif reportNonPreferredHp and not hpRecord.preferred:
+                qc.event(lineNum, 'npHp', line)
+                counts['npHp'] += 1
 
-            predicate = tokens[headers.index('predicate_id')]
             if predicate == '':
                 predicate = unspecified
             if predicate not in predicateIncludeList:
-                badPredCt += 1
-                fpLogCur.write('Line %s - Non-configured predicate: %s%s' % (lineNum, line, CRT))
+                counts['badPred'] += 1
+                qc.event(lineNum, 'badPred', line)
                 continue
 
             # strip off the prefix if it exists
-            predicate = predicate.split(':')[1]
-            
-            mapjust = tokens[headers.index('mapping_justification')]
+            predicate = stripPrefix(predicate)
+        
             if mapjust == '':
                 mapjust = unspecified
 
             # strip off the prefix if it exists
-            mapjust = mapjust.split(':')[1]
+            mapjust = stripPrefix(mapjust)
 
             # At this point we know the mp and hp IDs are valid (preferred or not)
             # Get the key and term, write to intermediate file - saves us this step
             # in the processor script. QC the term against the database
-            if mpPreferred:
-                mpKey = mpDict[mpID][0]
-                mpDbTerm = mpDict[mpID][1]
-            else:
-                mpKey = mpNpDict[mpID][0]
-                mpDbTerm = mpNpDict[mpID][1]
-
-            if hpPreferred:
-                hpKey = hpDict[hpID][0]
-                hpDbTerm = hpDict[hpID][1]
-            else:
-                hpKey = hpNpDict[hpID][0]
-                hpDbTerm = hpNpDict[hpID][1]
+            mpKey = mpRecord.key
+            mpDbTerm = mpRecord.term
+            hpKey = hpRecord.key
+            hpDbTerm = hpRecord.term
 
             # Don't use mpTermLabel or hpTermLabel when looking for dupes, there could be dupes
             # that have different mp/hp term labels 
-            lineForDupeCheck = '%s%s%s%s%s%s%s%s%s%s%s%s%s%s' % (mpID, TAB, mpKey, TAB, hpID, TAB, hpKey, TAB, predicate, TAB, mapjust, TAB, fileName, CRT)
+            dupeKey = (mpID, mpKey, hpID, hpKey, predicate, mapjust, fileName)
+
+            # share the lookup's copy of the IDs and of labels that match the term
+            if mpTermLabel == mpDbTerm:
+                mpTermLabel = mpDbTerm
+            if hpTermLabel == hpDbTerm:
+                hpTermLabel = hpDbTerm
 
-            lineToWrite = '%s%s%s%s%s%s%s%s%s%s%s%s%s%s%s%s%s%s' % (mpID, TAB, mpTermLabel, TAB, mpKey, TAB, hpID, TAB, hpTermLabel, TAB, hpKey, TAB, predicate, TAB, mapjust, TAB, fileName, CRT)
+            record = mappingrecord.MappingRecord(mpRecord.accid, mpTermLabel, mpKey, hpRecord.accid, hpTermLabel, hpKey, predicate, mapjust, fileName)
 
             # skip any duplicates
-            if lineForDupeCheck in lineList:
-                #print('Dupe Line: %s -  %s' % (lineNum, lineToWrite))
-                dupeCt +=1
-                fpLogCur.write('Dupe Line: %s - %s' % (lineNum, lineToWrite))
+            if dupeKey in dupeSet:
+                counts['dupe'] +=1
+                qc.event(lineNum, 'dupe', str.rstrip(record.format(), CRT))
                 continue
 
             # Now AFTER we check for dupes, report discrepancies between term labels and database terms
             if str.lower(mpDbTerm) != str.lower(mpTermLabel):
-                fpLogCur.write('Line %s - Database MP Term: "%s" does not match input term(relationship loaded): %s%s' % (lineNum, mpDbTerm, line, CRT))
-                mpBadTermCt += 1
+                qc.event(lineNum, 'mpBadTerm', mpDbTerm, line)
+                counts['mpBadTerm'] += 1
 
             if str.lower(hpDbTerm) != str.lower(hpTermLabel):
-                fpLogCur.write('Line %s - Database HP Term: "%s" does not match input term(relationship loaded): %s%s' % (lineNum, hpDbTerm, line, CRT))
-                hpBadTermCt += 1
-
-            lineList.append(lineForDupeCheck)
-            fpInputInt.write(lineToWrite)
-            goodCt += 1    
-            totalGoodCt += 1
-        fpInput.close()
-        fpLogCur.write('Total Records: %s%s' % (recordCt, CRT))
-        fpLogCur.write('Total Dupes: %s%s' % (dupeCt, CRT))
-        fpLogCur.write('Total Records with Blank MP ID: %s%s' % (blankMpCt, CRT))
-        fpLogCur.write('Total Records with Blank HP ID: %s%s' % (blankHpCt, CRT))
-
-        fpLogCur.write('Total Records with Invalid MP ID: %s%s' % (badMpCt, CRT))
-        fpLogCur.write('Total Records with Invalid HP ID: %s%s' % (badHpCt, CRT))
-        
-        fpLogCur.write('Total Records with Secondary MP ID (relationship loaded): %s%s' % (npMpCt, CRT))
-        fpLogCur.write('Total Records with Secondary HP ID (relationship loaded): %s%s' % (npHpCt, CRT))
+                qc.event(lineNum, 'hpBadTerm', hpDbTerm, line)
+                counts['hpBadTerm'] += 1
 
-        fpLogCur.write('Total Records where input MP label does not match database term (relationship loaded): %s%s' % (mpBadTermCt, CRT))
-        fpLogCur.write('Total Records where input HP label does not match database term (relationship loaded): %s%s' % (hpBadTermCt, CRT))
+            dupeSet.add(dupeKey)
+            yield record
 
-        fpLogCur.write('Total Records with HP sssom:NoTermFound: %s%s' % (hpNotFoundCt, CRT))
-        fpLogCur.write('Total Records with non-configured Predicate: %s%s' % (badPredCt, CRT))
-        fpLogCur.write('Total Records written to Intermediate File: %s%s' % (goodCt, CRT))
-        # -- end of current file parsing
+    #
+    # Purpose: QC a whole input file as columns, the VALIDATION_ENGINE=columnar
+    #	alternative to validateRecords()
+    # Returns: number of records that pass QC
+    # Assumes: lookups have been loaded, numpy is installed, no other input
+    #	file has the same name
+    # Effects: reads the file, adds events to qc, updates counts, calls 
+    #	write(text) with the intermediate file lines, the same lines, 
+    #	events and counts as validateRecords()
+    # Throws: InputFileError as tokenizeLines()
+    # Notes: the file is split into columns with one split() of its data
+    #	lines; the lookups and prefixes are resolved once per distinct ID,
+    #	predicate and justification, every check is a numpy operation on a
+    #	whole column and the intermediate file lines and events are built
+    #	by joining columns. Dupes are found within the file (the dupe key
+    #	includes the file name), so dupeSet is not used. A file whose data
+    #	lines are not all columns of its one header (comments or a header
+    #	among the data, a short or long line) is validated row by row
+    #
+    def validateColumns(self, fileName, fpInput, counts, dupeSet, qc, write):
 
-    fpLogCur.write('%sTotal Records from all files written to Intermediate File: %s%s' % (CRT, totalGoodCt, CRT))
+        # the lines of readLines(), the text is read with universal newlines
+        lines = str.split(fpInput.read(), CRT)
+        if lines[-1] == '':
+            lines.pop()
 
-    # -- end of parsing files
+        headers = None
+        for start, line in enumerate(lines):
+            if str.find(line, '#') == 0:
+                continue
+            if str.find(line, 'subject_id') != -1:
+                headers = str.split(line, TAB)
+            break
+
+        if headers is not None:
+            compileColumnMap(fileName, headers)
+            dataLines = lines[start + 1:]
+            dataText = CRT.join(dataLines)
+            columnCount = len(headers)
+            rowCount = len(dataLines)
+            tabCounts = numpy.fromiter(map(str.count, dataLines, itertools.repeat(TAB)), dtype=numpy.int64, count=rowCount)
+
+        if headers is None or str.find(dataText, 'subject_id') != -1 or str.find(dataText, '#') == 0 \
+                or str.find(dataText, CRT + '#') != -1 or (tabCounts != columnCount - 1).any():
+            goodCt = 0
+            for record in self.validateRecords(fileName, tokenizeLines(fileName, enumerate(lines, 1)), counts, dupeSet, qc):
+                write(record.format())
+                goodCt += 1
+            return goodCt
+
+        counts['record'] += rowCount
+        if rowCount == 0:
+            return 0
+
+        # every data line has a value for every column
+        values = str.split(str.join(TAB, dataLines), TAB)
+        mpIDs, mpTermLabels, hpIDs, hpTermLabels, predicates, mapjusts = \
+            [values[headers.index(c)::columnCount] for c in requiredColumns]
+        del values
+        lineColumn = objectColumn(dataLines)
+        # line numbers of the data lines
+        lineNums = numpy.arange(start + 2, start + 2 + rowCount)
+
+        # IDs, predicates and justifications as factorized columns: the 
+        # distinct values and each row's index into them
+        mpUniq, mpInv = factorize(mpIDs)
+        hpUniq, hpInv = factorize(hpIDs)
+        predUniq, predInv = factorize(predicates)
+        predUniq = [v or unspecified for v in predUniq]
+        justUniq, justInv = factorize(mapjusts)
+        justUniq = [v or unspecified for v in justUniq]
+
+        # join the distinct IDs to the lookups
+        mpTerms = [self.lookups.mp.get(v) for v in mpUniq]
+        hpTerms = [self.lookups.hp.get(v) for v in hpUniq]
+        mpFound = numpy.array([t is not None for t in mpTerms], dtype=bool)[mpInv]
+        hpFound = numpy.array([t is not None for t in hpTerms], dtype=bool)[hpInv]
+        mpPreferred = numpy.array([t is not None and bool(t.preferred) for t in mpTerms], dtype=bool)[mpInv]
+        hpPreferred = numpy.array([t is not None and bool(t.preferred) for t in hpTerms], dtype=bool)[hpInv]
+        hpNoTerm = numpy.array([v == 'sssom:NoTermFound' for v in hpUniq], dtype=bool)[hpInv]
+
+        # the checks of validateRecords(), in the same order: a row that fails
+        # one is not looked at by the next
+        blankMp = numpy.array([v == '' for v in mpUniq], dtype=bool)[mpInv]
+        live = ~blankMp
+        blankHp = live & numpy.array([v == '' for v in hpUniq], dtype=bool)[hpInv]
+        live &= ~blankHp
+        badMp = live & ~mpFound
+        live &= ~badMp
+        npMp = live & ~mpPreferred
+        hpNotFound = live & ~hpFound & hpNoTerm
+        badHp = live & ~hpFound & ~hpNoTerm
+        live &= hpFound
+        if self.reportNonPreferredHp:
+            npHp = live & ~hpPreferred
+        else:
+            npHp = numpy.zeros(rowCount, dtype=bool)
+        badPred = live & ~numpy.array([v in self.predicateIncludeList for v in predUniq], dtype=bool)[predInv]
+        live &= ~badPred
+
+        # strip the prefixes of the values still in use only, the others may
+        # not have one; values that are the same once stripped share a code
+        predStripped = [''] * len(predUniq)
+        predCodes = numpy.zeros(len(predUniq), dtype=numpy.int64)
+        strippedIndex = {}
+        for i in numpy.unique(predInv[live]).tolist():
+            predStripped[i] = self.stripPrefix(predUniq[i])
+            predCodes[i] = strippedIndex.setdefault(predStripped[i], len(strippedIndex))
+        justStripped = [''] * len(justUniq)
+        justCodes = numpy.zeros(len(justUniq), dtype=numpy.int64)
+        strippedIndex = {}
+        for i in numpy.unique(justInv[live]).tolist():
+            justStripped[i] = self.stripPrefix(justUniq[i])
+            justCodes[i] = strippedIndex.setdefault(justStripped[i], len(strippedIndex))
+
+        # dupes: every row after the first with the same IDs, predicate and
+        # justification (the keys follow from the IDs, the file name is the same)
+        # as one integer code when it fits in 64 bits, else as rows of codes
+        liveRows = numpy.flatnonzero(live)
+        keyColumns = [mpInv[liveRows], hpInv[liveRows], predCodes[predInv[liveRows]], justCodes[justInv[liveRows]]]
+        if len(mpUniq) * len(hpUniq) * len(predUniq) * len(justUniq) < 2 ** 63:
+            dupeKeys = ((keyColumns[0] * len(hpUniq) + keyColumns[1]) * len(predUniq) + keyColumns[2]) \
+                * len(justUniq) + keyColumns[3]
+            firstRows = numpy.unique(dupeKeys, return_index=True)[1]
+        else:
+            firstRows = numpy.unique(numpy.stack(keyColumns, axis=1), axis=0, return_index=True)[1]
+        isFirst = numpy.zeros(len(liveRows), dtype=bool)
+        isFirst[firstRows] = True
+        dupe = numpy.zeros(rowCount, dtype=bool)
+        dupe[liveRows[~isFirst]] = True
+        goodRows = liveRows[isFirst]
+
+        # the intermediate file line of every row that gets as far as the
+        # dupe check, the dupe event shows it too
+        mpColumns = [objectColumn(mpUniq), objectColumn([str(t.key) if t else '' for t in mpTerms])]
+        hpColumns = [objectColumn(hpUniq), objectColumn([str(t.key) if t else '' for t in hpTerms])]
+        liveMp = mpInv[liveRows]
+        liveHp = hpInv[liveRows]
+        liveLines = objectColumn(list(map(str.join, itertools.repeat(TAB), zip(
+            mpColumns[0][liveMp].tolist(), objectColumn(mpTermLabels)[liveRows].tolist(), mpColumns[1][liveMp].tolist(),
+            hpColumns[0][liveHp].tolist(), objectColumn(hpTermLabels)[liveRows].tolist(), hpColumns[1][liveHp].tolist(),
+            objectColumn(predStripped)[predInv[liveRows]].tolist(), objectColumn(justStripped)[justInv[liveRows]].tolist(),
+            itertools.repeat(fileName)))))
+
+        # case-insensitive label checks of the records to load
+        mpBadTerm = numpy.zeros(rowCount, dtype=bool)
+        hpBadTerm = numpy.zeros(rowCount, dtype=bool)
+        mpDbTerms = objectColumn([t.term if t else '' for t in mpTerms])
+        hpDbTerms = objectColumn([t.term if t else '' for t in hpTerms])
+        if len(goodRows):
+            mpBadTerm[goodRows] = objectColumn([str.lower(t) for t in mpDbTerms])[mpInv[goodRows]] != \
+                objectColumn(list(map(str.lower, objectColumn(mpTermLabels)[goodRows].tolist())))
+            hpBadTerm[goodRows] = objectColumn([str.lower(t) for t in hpDbTerms])[hpInv[goodRows]] != \
+                objectColumn(list(map(str.lower, objectColumn(hpTermLabels)[goodRows].tolist())))
+
+        # the events, as (lineNum, category, payload) columns, in line order
+        # and the events of a row in the order validateRecords() adds them
+        dupeLines = numpy.zeros(rowCount, dtype=object)
+        dupeLines[liveRows] = liveLines
+        checks = [('blankMp', blankMp, [lineColumn]), ('blankHp', blankHp, [lineColumn]), 
+            ('badMp', badMp, [lineColumn]), ('npMp', npMp, [lineColumn]), 
+            ('hpNotFound', hpNotFound, [lineColumn]), ('badHp', badHp, [lineColumn]), 
+            ('npHp', npHp, [lineColumn]), ('badPred', badPred, [lineColumn]), 
+            ('dupe', dupe, [dupeLines]), 
+            ('mpBadTerm', mpBadTerm, [mpDbTerms[mpInv], lineColumn]), 
+            ('hpBadTerm', hpBadTerm, [hpDbTerms[hpInv], lineColumn])]
+        eventRows = []
+        eventOrder = []
+        events = []
+        for order, (category, mask, payloadColumns) in enumerate(checks):
+            flagged = numpy.flatnonzero(mask)
+            counts[category] += len(flagged)
+            eventRows.append(flagged)
+            eventOrder.append(numpy.full(len(flagged), order))
+            events.extend(zip(lineNums[flagged].tolist(), itertools.repeat(category), 
+                zip(*[c[flagged].tolist() for c in payloadColumns])))
+        eventRows = numpy.concatenate(eventRows)
+        eventOrder = numpy.concatenate(eventOrder)
+        qc.addEvents(map(events.__getitem__, numpy.lexsort((eventOrder, eventRows)).tolist()))
+
+        if len(goodRows):
+            write(str.join(CRT, liveLines[isFirst].tolist()) + CRT)
+
+        return len(goodRows)
+
+    #
+    # Purpose: strip the prefix off a predicate or justification
+    #	('skos:exactMatch' -> 'exactMatch'), once per distinct value
+    # Returns: the interned value without its prefix, the value itself
+    #	if it has none (unspecified)
+    # Assumes: Nothing
+    # Effects: adds to prefixFreeValues
+    # Throws: Nothing
+    #
+    def stripPrefix(self, value):
+
+        stripped = self.prefixFreeValues.get(value)
+        if stripped is None:
+            tokens = value.split(':')
+            stripped = self.prefixFreeValues[value] = sys.intern(tokens[1] if len(tokens) > 1 else value)
+
+        return stripped
+
+#
+# Purpose: parse one input file in a worker process
+# Returns: (records that pass QC, QC section for the file, file metrics
+#	or None if the file could not be parsed)
+# Assumes: the worker was forked after the lookups were loaded
+# Effects: Nothing
+# Throws: Nothing
+#
+def parseFileWorker(fileName):
+
+    records = []
+    qc = QcEventSink()
+    fileMetrics = None
+
+    # dupes are keyed on fileName, so a per-file dupe set finds the same dupes
+    try:
+        validator.parseFile(fileName, set(), qc, records.append)
+        fileMetrics = metrics.files[-1]
+    except InputFileError as e:
+        qc.error(str(e))
+
+    return records, qc.sections[0], fileMetrics
+
+#
+# Purpose: write the curation log report, and the JSON form of the QC 
+#	events if LOG_CUR_JSON is set
+# Returns: Nothing
+# Assumes: fpLogCur has been opened
+# Effects: writes to the file system
+# Throws: Nothing
+#
+def writeQcReports(qc, totalGoodCt=None):
+
+    fpLogCur.write(qc.renderText(totalGoodCt))
 
+    if logCurJsonFile:
+        try:
+            fp = open(logCurJsonFile, 'w')
+            qc.writeJson(fp)
+            fp.close()
+        except IOError as e:
+            print('Cannot write file: %s %s' % (logCurJsonFile, e))
+
+#
+# Purpose: check the header of every input file before any is parsed, 
+#	so a malformed file fails the load before the lookups are waited for
+# Returns: 0, 1 if an input file is missing a required column
+# Assumes: fpLogDiag and fpLogCur have been opened
+# Effects: on error writes the error to the diagnostic and curation logs
+# Throws: Nothing
+#
+def checkInputHeaders():
+
+    for fileName in config.inputFileNames:
+        fp = openInputFile(config.downloadDir, fileName)
+        try:
+            # the first data line, all that is needed to reach the header
+            next(tokenizeLines(fileName, readLines(fp)), None)
+        except InputFileError as e:
+            print(e)
+            qc = QcEventSink()
+            qc.startFile(fileName)
+            qc.error(str(e))
+            fpLogDiag.write('%s%s' % (e, CRT))
+            writeQcReports(qc)
+            return 1
+        finally:
+            fp.close()
 
     return 0
 
 #
-#  MAIN
+# Purpose: parse the set of input files
+# Returns: 0, 1 if an input file is missing a required column or the 
+#	lookups could not be loaded
+# Assumes: 
+# Effects: Nothing
+# Throws: Nothing
 #
+def parseInputFiles(recordSink=None):
+    # loop through the configured files streaming each one through
+    # readLines -> tokenizeLines -> validateRecords and writing the
+    # records that pass to the intermediate file and/or passing them
+    # to recordSink (the fused load); with VALIDATION_ENGINE=columnar
+    # and no recordSink each file is QC'd as columns by validateColumns
+    #
+    # with PARSE_WORKERS > 1 each file is parsed in a worker process and
+    # the results are merged here in INPUT_FILE_NAMES order
+    
+    # parse out the columns we want:
+    # MP ID = subject_id
+    # HP ID = object_id
+    # predicate value = predicate_id (load only those in predicateIncludeList)
+    # mapping justification = mapping_justification
+
+    def emit(record):
+        if fpInputInt:
+            fpInputInt.write(record.format())
+        if recordSink:
+            recordSink(record)
+
+    if waitForLookups() != 0:
+        return 1
 
-print('initialize: %s' % time.strftime("%H.%M.%S.%m.%d.%y", time.localtime(time.time())))
-if initialize() != 0:
-    sys.exit(1)
+    fileNames = config.inputFileNames
+    totalGoodCt = 0 
+    qc = QcEventSink()
+
+    if config.parseWorkers > 1 and len(fileNames) > 1:
+        # fork so the workers share the lookups loaded by initialize()
+        pool = multiprocessing.get_context('fork').Pool(min(config.parseWorkers, len(fileNames)))
+        try:
+            for fileName, result in zip(fileNames, pool.imap(parseFileWorker, fileNames)):
+                print('fileName: %s' % fileName)
+                records, section, fileMetrics = result
+                qc.addSection(section)
+                if fileMetrics:
+                    metrics.files.append(fileMetrics)
+                for record in records:
+                    emit(record)
+                totalGoodCt += len(records)
+                error = section[3]
+                if error:
+                    print(error)
+                    fpLogDiag.write('%s%s' % (error, CRT))
+                    writeQcReports(qc)
+                    return 1
+        finally:
+            pool.terminate()
+    else:
+        # used for checking dupes in the input
+        # {(mpID, mpKey, hpID, hpKey, predicate, justification, fileName), ...}
+        dupeSet = set()
+
+        # the columnar engine writes the intermediate file lines itself; its
+        # dupes are found per file, so not when a file name is listed twice
+        write = None
+        if recordSink is None and fpInputInt and len(set(fileNames)) == len(fileNames):
+            write = fpInputInt.write
+
+        for fileName in fileNames:
+            print('fileName: %s' % fileName)
+            try:
+                totalGoodCt += validator.parseFile(fileName, dupeSet, qc, emit, write)
+            except InputFileError as e:
+                print(e)
+                qc.error(str(e))
+                fpLogDiag.write('%s%s' % (e, CRT))
+                writeQcReports(qc)
+                return 1
+            # -- end of current file parsing
+
+    with metrics.stage('writeQcReports'):
+        writeQcReports(qc, totalGoodCt)
+
+    # -- end of parsing files
 
-print('openFiles: %s' % time.strftime("%H.%M.%S.%m.%d.%y", time.localtime(time.time())))
-if openFiles() != 0:
-    sys.exit(1)
 
-print('parseInputFiles: %s' % time.strftime("%H.%M.%S.%m.%d.%y", time.localtime(time.time())))
-if parseInputFiles() != 0:
-    sys.exit(1)
+    return 0
+
+#
+# Purpose: run the preprocessor
+# Returns: Nothing
+# Assumes: Nothing
+# Effects: exits with 0 on success, 1 on error
+# Throws: Nothing
+#
+def main():
+    global checkpoint, metrics
+
+    loadConfig = loadconfig.LoadConfig()
+    metrics = loadmetrics.LoadMetrics('preprocess', loadConfig)
+
+    # the intermediate file of an interrupted load is used as it is
+    if loadConfig.resumeLoad:
+        if loadConfig.checkpointFile is None:
+            print('Missing load settings: checkpointFile')
+            sys.exit(1)
+        with metrics.stage('readCheckpoint'):
+            checkpoint = loadcheckpoint.LoadCheckpoint(loadConfig, getLookupSignature())
+        if checkpoint.isComplete('preprocess'):
+            print('preprocess: complete in checkpoint %s, skipped' % loadConfig.checkpointFile)
+            metrics.write()
+            sys.exit(0)
+
+    with metrics.stage('initialize') as stage:
+        if initialize(loadConfig) != 0:
+            sys.exit(1)
+        # still loading with CONCURRENT_STARTUP, counted by waitForLookups
+        if lookupThread is None:
+            stage.rows = len(lookups)
+
+    with metrics.stage('openFiles'):
+        if openFiles() != 0:
+            sys.exit(1)
+
+    if lookupThread is not None:
+        with metrics.stage('checkInputHeaders'):
+            if checkInputHeaders() != 0:
+                sys.exit(1)
+
+        with metrics.stage('waitForLookups') as stage:
+            if waitForLookups() != 0:
+                sys.exit(1)
+            stage.rows = len(lookups)
+
+    with metrics.stage('parseInputFiles') as stage:
+        if parseInputFiles() != 0:
+            sys.exit(1)
+        stage.rows = sum([f['rows'] for f in metrics.files])
+
+    closeFiles()
+
+    if checkpoint is not None:
+        checkpoint.complete('preprocess', [inputFileInt], rows=stage.rows)
+
+    metrics.write()
+    print('done: %s' % time.strftime("%H.%M.%S.%m.%d.%y", time.localtime(time.time())))
+    sys.exit(0)
+
+#
+#  MAIN
+#
 
-closeFiles()
-print('done: %s' % time.strftime("%H.%M.%S.%m.%d.%y", time.localtime(time.time())))
-sys.exit(0)
+if __name__ == '__main__':
+    main()
@@ -10,6 +10,9 @@
 #
 #      process.py 
 #
+#      or as a library, nothing is read or opened on import: KeyBlock
+#      reserves keys, RowRenderer renders the bcp rows of a MappingRecord
+#
 #  Inputs:
 #
 #	1. load-ready MP/HP file tab-delimited in the following format
@@ -50,6 +53,21 @@
 #      6) Delete existing relationships
 #      7) BCP in new relationships:
 #
+#      In delta mode (LOAD_MODE=delta) existing relationships are loaded
+#      before the input file is parsed; only the relationships no longer in
+#      the input are deleted, only new ones are bcp'd in and changed
+#      property values are updated.
+#
+#      In swap mode (LOAD_MODE=swap) the input is compared with the existing
+#      relationships as in delta mode, the new relationships are bcp'd into
+#      unlogged staging tables and, once their row counts are checked, one
+#      transaction deletes the removed relationships, updates the changed
+#      property values and inserts the staged rows (steps 6 and 7 together).
+#
+#      With RESUME_LOAD the bcp files, the deletes and the bcp of each table
+#      are recorded in LOAD_CHECKPOINT as they complete; a rerun of an
+#      interrupted load skips them (see loadcheckpoint.py).
+#
 #  Notes:  None
 #
 ###########################################################################
@@ -65,10 +83,16 @@
 
 import sys
 import os
+import io
 import time
 
 import db
 import mgi_utils
+import loadconfig
+import loadcheckpoint
+import loadmetrics
+import mappingrecord
+import preprocess
 
 #
 #  CONSTANTS
@@ -82,20 +106,40 @@ USAGE='process.py'
 #  GLOBALS
 #
 
-# input file
-inFile = os.environ['INPUT_FILE_TOLOAD']
+# the load's settings, see loadconfig.py; set by initialize()
+config = None
+
+# output bcp files, in OUTPUTDIR
+relationshipFile = None
+propertyFile = None
+
+# number of keys per delete or update statement in delta mode
+deltaBatchSize = 1000
+
+# number of relationships deleted by doDeletes(), None if not counted
+deleteCt = None
 
-# output bcp files
-relBcpFile =   os.environ['RELATIONSHIP_BCP']
-propBcpFile = os.environ['PROPERTY_BCP']
+# LOAD_ENGINE=copy streams the rows into the database with COPY FROM STDIN
+# instead of writing bcp files, see loadconfig.py
+useCopy = 0
 
-outputDir = os.environ['OUTPUTDIR']
-relationshipFile = '%s/%s' % (outputDir, relBcpFile)
-propertyFile = '%s/%s' % (outputDir, propBcpFile)
+# the copy engine inserts while processing, so a full load deletes first
+deleteFirst = 0
 
-# if 'true',bcp files will not be bcp-ed into the database.
-# Default is 'false'
-DEBUG = os.getenv('LOG_DEBUG')
+# delta and swap mode compare the input with the relationships already
+# loaded, see loadExisting()
+diffExisting = 0
+
+# the completed stages with RESUME_LOAD, see loadcheckpoint.py; None if
+# they are not recorded
+checkpoint = None
+
+# stage timings, see loadmetrics.py; created by main()
+metrics = None
+
+# number of MGI_Relationship, MGI_Relationship_Property rows written
+relationshipCt = 0
+propertyCt = 0
 
 # file descriptors
 fpInFile = ''
@@ -140,66 +184,359 @@ mpLabelSeqNum = 4
 hpLabelPropNameKey = 109877779 # hp_mapping_label
 hpLabelSeqNum = 5
 
-
-# database primary keys, will be set to the next available from the db
-nextRelationshipKey = 1000	# MGI_Relationship._Relationship_key
-nextPropertyKey = 1000          # MGI_Relationship_Property._RelationshipProperty_key
+class SegmentCache(dict):
+    # Is: the rendered tail of one property's rows (property name key, value,
+    #	sequence number and row suffix) by value, for the properties with a 
+    #	handful of distinct values: predicate, justification, file name
+    # Has: the template segments before and after the value
+    # Does: renders the segment on the first lookup of a value
+
+    def __init__(self, before, after):
+        dict.__init__(self)
+        self.before = before
+        self.after = after
+
+    def __missing__(self, value):
+        segment = self[value] = ''.join([self.before, value, self.after])
+        return segment
+
+# end class SegmentCache -------------------------------
+
+class RowRenderer:
+    # Is: the bcp rows of a relationship and its properties
+    # Has: the constant segments of every row, rendered once from the
+    #	user key and the date, the SegmentCaches of the predicate,
+    #	justification and file name property rows
+    # Does: relationship() renders an MGI_Relationship row, property() an
+    #	MGI_Relationship_Property row, properties() the five property rows
+    #	of a record; the keys are passed in as strings
+
+    def __init__(self, userKey, date):
+        # trailing columns shared by both tables: created by, modified by, dates
+        rowSuffix = '%s%s%s%s%s%s%s%s%s' % (TAB, userKey, TAB, userKey, TAB, date, TAB, date, CRT)
+
+        # MGI_Relationship: key + relRowMiddle + objKey1 + TAB + objKey2 + relRowSuffix
+        self.relRowMiddle = '%s%s%s' % (TAB, catKey, TAB)
+        self.relRowSuffix = '%s%s%s%s%s%s%s%s%s' % (TAB, relKey, TAB, qualKey, TAB, evidKey, TAB, refsKey, rowSuffix)
+
+        # MGI_Relationship_Property: key + TAB + relationship key + template[0] + value + template[1]
+        # {propNameKey : (segment before the value, segment after the value), ...}
+        self.propRowTemplates = dict([(k, ('%s%s%s' % (TAB, k, TAB), '%s%s%s' % (TAB, n, rowSuffix))) for k, n in 
+            [(predPropNameKey, predSeqNum), (justPropNameKey, justSeqNum), (filePropNameKey, fileSeqNum), 
+             (mpLabelPropNameKey, mpLabelSeqNum), (hpLabelPropNameKey, hpLabelSeqNum)]])
+
+        self.mpLabelRowBefore, self.mpLabelRowAfter = self.propRowTemplates[mpLabelPropNameKey]
+        self.hpLabelRowBefore, self.hpLabelRowAfter = self.propRowTemplates[hpLabelPropNameKey]
+
+        self.predSegments = SegmentCache(*self.propRowTemplates[predPropNameKey])
+        self.justSegments = SegmentCache(*self.propRowTemplates[justPropNameKey])
+        self.fileSegments = SegmentCache(*self.propRowTemplates[filePropNameKey])
+
+    def relationship(self, relationshipKey, objKey1, objKey2):
+        return ''.join([relationshipKey, self.relRowMiddle, objKey1, TAB, objKey2, self.relRowSuffix])
+
+    def property(self, propertyKey, relationshipKey, propNameKey, value):
+        before, after = self.propRowTemplates[propNameKey]
+        return ''.join([propertyKey, TAB, relationshipKey, before, value, after])
+
+    def properties(self, propertyKeys, relationshipKey, record):
+        # predicate, justification, filename, hp term label, mp term label
+        p1, p2, p3, p4, p5 = propertyKeys
+        relationshipColumn = TAB + relationshipKey
+        return ''.join([
+            p1, relationshipColumn, self.predSegments[record.predicate],
+            p2, relationshipColumn, self.justSegments[record.justification],
+            p3, relationshipColumn, self.fileSegments[record.fileName],
+            p4, relationshipColumn, self.hpLabelRowBefore, record.hpTermLabel, self.hpLabelRowAfter,
+            p5, relationshipColumn, self.mpLabelRowBefore, record.mpTermLabel, self.mpLabelRowAfter])
+
+# end class RowRenderer -------------------------------
+
+# the constant segments of every row are rendered once, processRecord() 
+# only joins them with the per-row values
+renderer = RowRenderer(userKey, DATE)
+
+# rendered rows waiting to be written, written every rowBufferSize relationships
+relRowBuffer = []
+propRowBuffer = []
+rowBufferSize = 10000
+
+
+# database primary keys, reserved from the sequences, see KeyBlock
+relationshipKeys = None		# MGI_Relationship._Relationship_key
+propertyKeys = None		# MGI_Relationship_Property._RelationshipProperty_key
+
+# keys reserved at a time when the reserved keys run out: the fused load
+# cannot count its records up front, delta mode may add missing properties
+keyBlockSize = 1000
+
+# delta and swap mode
+# relationships already loaded by this load
+# {(objKey1, objKey2, predicate, justification, fileName) : [relationshipKey, {propNameKey : [propertyKey, value], ...}], ...}
+existingDict = {}
+
+# number of relationships already loaded that the input is compared with
+existingCt = 0
+
+# relationships to delete, existing relationships not in the input
+deleteKeyList = []
+
+# property values to update [(propertyKey, value), ...]
+updateList = []
+
+class CopyWriter:
+    # Is: a file-like writer of bcp rows that streams them into a table
+    #	with COPY FROM STDIN instead of writing them to a file
+    # Has: the table, a buffer of up to batchSize rows and an optional 
+    #	writer that must be flushed first (the parent table of a foreign key)
+    # Does: write(), flush(), close()
+
+    def __init__(self, cursor, table, batchSize, parent=None):
+        self.cursor = cursor
+        self.table = table
+        self.batchSize = batchSize
+        self.parent = parent
+        self.rows = []
+        self.pendingCount = 0
+        self.rowCount = 0
+
+    def write(self, rows):
+        # rows is one or more CRT terminated rows
+        self.rows.append(rows)
+        self.pendingCount += rows.count(CRT)
+        if self.pendingCount >= self.batchSize:
+            self.flush()
+
+    def flush(self):
+        if self.parent:
+            self.parent.flush()
+        if not self.rows:
+            return
+        self.cursor.copy_expert("copy mgd.%s from stdin with null as ''" % self.table, io.StringIO(''.join(self.rows)))
+        self.rowCount += self.pendingCount
+        self.rows = []
+        self.pendingCount = 0
+
+    def close(self):
+        self.flush()
+
+# end class CopyWriter -------------------------------
+
+class KeyBlock:
+    # Is: keys reserved from a database sequence
+    # Has: the sequence name, the runs of contiguous reserved keys not yet
+    #	used, the number of keys to reserve when they run out
+    # Does: reserve(n) reserves n keys in one statement, next() returns
+    #	the next key, take(n) the next n keys
+    #
+    # nextval() is atomic, so keys reserved this way are never handed out
+    # to another loader and the sequence never has to be reset with setval(max())
+    # Reserved keys are contiguous unless another loader used the sequence
+    # while they were being reserved, so they are kept as runs
+
+    def __init__(self, sequence, growBy):
+        self.sequence = sequence
+        self.growBy = growBy
+        self.runs = []
+        self.nextKey = 0
+        self.runEnd = -1
+        self.reservedCount = 0
+
+    def reserve(self, n):
+        if n <= 0:
+            return
+        results = db.sql('''select min(k) as startKey, max(k) as endKey
+            from (select k, k - row_number() over (order by k) as grp
+                from (select nextval('%s') as k from generate_series(1, %s)) s) r
+            group by grp
+            order by startKey''' % (self.sequence, n), 'auto')
+        for r in results:
+            self.runs.append((r['startKey'], r['endKey']))
+        self.reservedCount += n
+
+    def next(self):
+        if self.nextKey > self.runEnd:
+            if not self.runs:
+                self.reserve(self.growBy)
+            self.nextKey, self.runEnd = self.runs.pop(0)
+        key = self.nextKey
+        self.nextKey += 1
+        return key
+
+    def take(self, n):
+        start = self.nextKey
+        if start + n - 1 <= self.runEnd:
+            self.nextKey = start + n
+            return range(start, start + n)
+        return [self.next() for i in range(n)]
+
+# end class KeyBlock -------------------------------
 
 # for bcp
-bcpin = '%s/bin/bcpin.csh' % os.environ['PG_DBUTILS']
-server = os.environ['MGD_DBSERVER']
-database = os.environ['MGD_DBNAME']
 relTable = 'MGI_Relationship'
 propTable = 'MGI_Relationship_Property'
 
-def initialize():
-    # Purpose: create lookups, open files, create db connection, gets max
-    #	keys from the db
-    # Returns: Nothing
+# swap mode: unlogged copies of the tables the rows are loaded into first
+relStageTable = 'MGI_Relationship_mphpstage'
+propStageTable = 'MGI_Relationship_Property_mphpstage'
+
+def initialize(openInput=1, loadConfig=None):
+    # Purpose: read the configuration (the environment unless loadConfig
+    #	is given), open files, create db connection, 
+    #	create the key blocks (see reserveKeys())
+    # Returns: 0, 1 if a required setting is missing or the copy engine
+    #	cannot create its staging tables
     # Assumes: Nothing
     # Effects: Sets global variables, creates files in the file system, creates connection to a database
+    #	With RESUME_LOAD reads the checkpoint, the bcp files of a completed
+    #	render are not opened
 
-    global nextRelationshipKey, nextPropertyKey
+    global config, relationshipFile, propertyFile, useCopy, deleteFirst, diffExisting
+    global relationshipKeys, propertyKeys, checkpoint
 
-    #
-    # Open input and output files
-    #
-    openFiles()
+    config = loadConfig or loadconfig.LoadConfig()
+
+    required = ['outputDir', 'relBcpFile', 'propBcpFile', 'pgDbUtils', 'server', 'database', 'user', 'passwordFile']
+    if openInput:
+        required.append('inputFileToLoad')
+    missing = config.missing(required)
+    if missing:
+        print('Missing load settings: %s' % ', '.join(missing))
+        return 1
+
+    relationshipFile = '%s/%s' % (config.outputDir, config.relBcpFile)
+    propertyFile = '%s/%s' % (config.outputDir, config.propBcpFile)
+    useCopy = config.loadEngine == 'copy' and not config.debug
+    deleteFirst = useCopy and config.loadMode == 'full'
+    diffExisting = config.loadMode in ('delta', 'swap')
 
     #
     # create database connection
     #
-    user = os.environ['MGD_DBUSER']
-    passwordFileName = os.environ['MGD_DBPASSWORDFILE']
     db.useOneConnection(1)
-    db.set_sqlUser(user)
-    db.set_sqlPasswordFromFile(passwordFileName)
+    db.set_sqlUser(config.user)
+    db.set_sqlPasswordFromFile(config.passwordFile)
+
+    # the copy engine commits all its rows at once, there is nothing to resume
+    if config.resumeLoad and not useCopy and not config.debug:
+        if config.checkpointFile is None:
+            print('Missing load settings: checkpointFile')
+            return 1
+        checkpoint = loadcheckpoint.LoadCheckpoint(config, preprocess.getLookupSignature())
+        if checkpoint.isComplete('render'):
+            restoreRender()
+            return 0
 
     #
-    # get next MGI_Relationship key
+    # Open input and output files
     #
-    results = db.sql('''select nextval('mgi_relationship_seq') as nextKey''', 'auto')
-    if results[0]['nextKey'] is None:
-        nextRelationshipKey = 1000
-    else:
-        nextRelationshipKey = results[0]['nextKey']
+    openFiles(openInput)
 
+    if useCopy and openCopyWriters() != 0:
+        return 1
 
-    #
-    # get next MGI_Relationship_Property key
-    #
-    results = db.sql('''select nextval('mgi_relationship_property_seq') as nextKey''', 'auto')
-    if results[0]['nextKey'] is None:
-        nextPropertyKey = 1000
-    else:
-        nextPropertyKey = results[0]['nextKey']
+    relationshipKeys = KeyBlock('mgi_relationship_seq', keyBlockSize)
+    propertyKeys = KeyBlock('mgi_relationship_property_seq', 5 * keyBlockSize)
 
     return 0
 
 # end initialize() -------------------------------
 
-def openFiles ():
+def isResumed(stage):
+    # Purpose: check whether stage completed in an interrupted run of the
+    #	load, see loadcheckpoint.py
+    # Returns: 1 if it did and is to be skipped, else 0
+    # Assumes: Nothing
+    # Effects: prints the stage that is skipped
+    # Throws: Nothing
+
+    if checkpoint is None or not checkpoint.isComplete(stage):
+        return 0
+
+    print('%s: complete in checkpoint %s, skipped' % (stage, config.checkpointFile))
+
+    return 1
+
+# end isResumed() -------------------------------
+
+def completeStage(stage, artifacts=(), **info):
+    # Purpose: record a completed stage in the checkpoint
+    # Returns: Nothing
+    # Assumes: Nothing
+    # Effects: replaces the checkpoint, see loadcheckpoint.py
+    # Throws: Nothing
+
+    if checkpoint is not None:
+        checkpoint.complete(stage, artifacts, **info)
+
+# end completeStage() -------------------------------
+
+def completeRender():
+    # Purpose: record the bcp files and what the later stages need of the
+    #	run that wrote them: the row counts and, in delta mode, the
+    #	relationships to delete and the values to update
+    # Returns: Nothing
+    # Assumes: closeFiles() has been run
+    # Effects: replaces the checkpoint
+    # Throws: Nothing
+
+    completeStage('render', [relationshipFile, propertyFile],
+        relationships=relationshipCt, properties=propertyCt,
+        existing=existingCt, deletes=deleteKeyList, updates=updateList)
+
+# end completeRender() -------------------------------
+
+def restoreRender():
+    # Purpose: restore what completeRender() recorded
+    # Returns: Nothing
+    # Assumes: the checkpoint has the render stage
+    # Effects: sets global variables
+    # Throws: Nothing
+
+    global relationshipCt, propertyCt, existingCt
+
+    info = checkpoint.info('render')
+    relationshipCt = info['relationships']
+    propertyCt = info['properties']
+    existingCt = info['existing']
+    deleteKeyList[:] = info['deletes']
+    updateList[:] = info['updates']
+
+# end restoreRender() -------------------------------
+
+def reserveKeys():
+    # Purpose: reserve the MGI_Relationship keys and 5 MGI_Relationship_Property
+    #	keys for each record of the intermediate file that will be inserted
+    # Returns: 0
+    # Assumes: fpInFile has been opened, in delta mode loadExisting() has been run
+    # Effects: reads the intermediate file, reserves keys from the sequences
+    # Throws: Nothing
+
+    count = 0
+    if diffExisting:
+        seen = set()
+        for record in readRecords(fpInFile):
+            identity = (int(record.mpKey), int(record.hpKey), record.predicate, record.justification, record.fileName)
+            if identity in existingDict and identity not in seen:
+                seen.add(identity)
+                continue
+            count += 1
+    else:
+        for line in fpInFile:
+            count += 1
+    fpInFile.seek(0)
+
+    relationshipKeys.reserve(count)
+    propertyKeys.reserve(5 * count)
+    print('reserved keys for %s relationships' % count)
+
+    return 0
+
+# end reserveKeys() -------------------------------
+
+def openFiles (openInput=1):
     # Purpose: Open input/output files.
+    #	The fused load passes records in memory and sets openInput to 0
     # Returns: Nothing
     # Assumes: Nothing
     # Effects: Sets global variables
@@ -208,11 +545,16 @@ def openFiles ():
     global fpInFile, fpRelationshipFile, fpPropertyFile
 
     try:
-        fpInFile = open(inFile, 'r')
+        if openInput:
+            fpInFile = open(config.inputFileToLoad, 'r')
     except:
-        print('Cannot open Feature relationships input file: %s' % inFile)
+        print('Cannot open Feature relationships input file: %s' % config.inputFileToLoad)
         return 1
 
+    # the copy engine streams to the database instead, see openCopyWriters()
+    if useCopy:
+        return 0
+
     try:
         fpRelationshipFile = open(relationshipFile, 'w')
     except:
@@ -229,6 +571,32 @@ def openFiles ():
 
 # end openFiles() -------------------------------
 
+def openCopyWriters():
+    # Purpose: create the writers process() uses in place of the bcp files,
+    #	on the db module's connection so the rows are committed with the
+    #	deletes and updates, see copyFiles()
+    # Returns: 0, 1 if the staging tables cannot be created
+    # Assumes: db.useOneConnection(1)
+    # Effects: Sets global variables, opens the database connection
+
+    global fpRelationshipFile, fpPropertyFile
+
+    relTarget, propTarget = relTable, propTable
+    if config.loadMode == 'swap':
+        if createStagingTables() != 0:
+            return 1
+        relTarget, propTarget = relStageTable, propStageTable
+
+    # the db module opens its one connection on the first statement
+    db.sql('''select 1''', 'auto')
+    cursor = db.sharedConnection.cursor()
+    fpRelationshipFile = CopyWriter(cursor, relTarget, config.copyBatchSize)
+    fpPropertyFile = CopyWriter(cursor, propTarget, config.copyBatchSize, fpRelationshipFile)
+
+    return 0
+
+# end openCopyWriters() -------------------------------
+
 
 def closeFiles ():
     # Purpose: Close all file descriptors
@@ -240,7 +608,9 @@ def closeFiles ():
     global fpInFile, fpRelationshipFile, fpPropertyFile
 
     try:
-        fpInFile.close()
+        writeRows()
+        if fpInFile:
+            fpInFile.close()
         fpRelationshipFile.close()
         fpPropertyFile.close()
     except:
@@ -250,6 +620,182 @@ def closeFiles ():
 
 # end closeFiles() -------------------------------
 
+def loadExisting():
+    # Purpose: load the relationships and properties already created by
+    #	this load, for delta and swap mode
+    # Returns: 0
+    # Assumes: database connection
+    # Effects: sets existingDict, existingCt and deleteKeyList
+    # Throws: Nothing
+    # Notes: a delta load of just the changed files (DELTA_FILE_NAMES, see
+    #	mp_hpmappingload.sh) compares only the relationships from those
+    #	files, the relationships of any other data_source are left alone;
+    #	any other delta or swap load compares all of this load's 
+    #	relationships, so those of a file no longer in INPUT_FILE_NAMES
+    #	are deleted
+
+    global existingCt
+
+    propsByRel = {}
+    objsByRel = {}
+    deltaFileNames = set(config.deltaFileNames)
+
+    results = db.sql('''select r._Relationship_key, r._Object_key_1, r._Object_key_2,
+            p._RelationshipProperty_key, p._PropertyName_key, p.value
+        from MGI_Relationship r, MGI_Relationship_Property p
+        where r._CreatedBy_key = %s
+        and r._Relationship_key = p._Relationship_key
+        order by r._Relationship_key''' % userKey, 'auto')
+    for r in results:
+        rKey = r['_Relationship_key']
+        objsByRel[rKey] = (r['_Object_key_1'], r['_Object_key_2'])
+        propsByRel.setdefault(rKey, {})[r['_PropertyName_key']] = [r['_RelationshipProperty_key'], r['value']]
+
+    for rKey in objsByRel:
+        props = propsByRel[rKey]
+        identity = objsByRel[rKey] + \
+            tuple([props.get(k, [None, None])[1] for k in (predPropNameKey, justPropNameKey, filePropNameKey)])
+
+        if deltaFileNames and identity[4] is not None and identity[4] not in deltaFileNames:
+            continue
+
+        # a relationship loaded twice is deleted and only the first one kept
+        if identity in existingDict:
+            deleteKeyList.append(rKey)
+        else:
+            existingDict[identity] = [rKey, props]
+
+    existingCt = len(existingDict) + len(deleteKeyList)
+    print('existing relationships: %s' % len(objsByRel))
+
+    return 0
+
+# end loadExisting() -------------------------------
+
+def writeProperty(relationshipKey, propNameKey, value):
+    # Purpose: render one MGI_Relationship_Property bcp row
+    # Returns: Nothing
+    # Assumes: Nothing
+    # Effects: uses a property key, adds to propRowBuffer
+    # Throws: Nothing
+
+    propRowBuffer.append(renderer.property(str(propertyKeys.next()), str(relationshipKey), propNameKey, value))
+
+# end writeProperty() -------------------------------
+
+def writeRows():
+    # Purpose: write the rendered rows to the bcp files (or copy writers),
+    #	relationships first
+    # Returns: Nothing
+    # Assumes: fpRelationshipFile, fpPropertyFile have been opened
+    # Effects: writes to the file system, empties the row buffers
+    # Throws: Nothing
+
+    global relationshipCt, propertyCt
+
+    if relRowBuffer:
+        relationshipCt += len(relRowBuffer)
+        fpRelationshipFile.write(''.join(relRowBuffer))
+        del relRowBuffer[:]
+
+    if propRowBuffer:
+        rows = ''.join(propRowBuffer)
+        propertyCt += rows.count(CRT)
+        fpPropertyFile.write(rows)
+        del propRowBuffer[:]
+
+# end writeRows() -------------------------------
+
+def compareExisting(existing, propValues):
+    # Purpose: compare an input record with the relationship already
+    #	loaded for it, for delta and swap mode
+    # Returns: Nothing
+    # Assumes: Nothing
+    # Effects: adds changed values to updateList, writes missing
+    #	properties to the property bcp file
+    # Throws: Nothing
+
+    rKey, props = existing
+    for propNameKey, value in propValues:
+        if propNameKey not in props:
+            writeProperty(rKey, propNameKey, value)
+        elif props[propNameKey][1] != value:
+            updateList.append((props[propNameKey][0], value))
+
+# end compareExisting() -------------------------------
+
+def readRecords(fp):
+    # Purpose: stream the intermediate file one line at a time
+    # Returns: generator of a MappingRecord for each line
+    # Assumes: fp is open
+    # Effects: reads from fp
+    # Throws: Nothing
+
+    for line in fp:
+        yield mappingrecord.parseLine(line)
+
+# end readRecords() -------------------------------
+
+def processRecord(record):
+    # Purpose: create the relationship and property bcp rows for one
+    #	record of the intermediate file
+    # Returns: Nothing
+    # Assumes: file descriptors have been initialized, record is a 
+    #	MappingRecord of stripped strings
+    # Effects: uses keys, writes to the file system
+    # Throws: Nothing
+
+    mpLabel =  record.mpTermLabel
+    objKey1 = record.mpKey
+    hpLabel = record.hpTermLabel
+    objKey2 =  record.hpKey
+    predicate = record.predicate
+    justification = record.justification
+    fileName = record.fileName
+
+    if diffExisting:
+        identity = (int(objKey1), int(objKey2), predicate, justification, fileName)
+        existing = existingDict.pop(identity, None)
+        if existing is not None:
+            compareExisting(existing, [(predPropNameKey, predicate), 
+                (justPropNameKey, justification), 
+                (filePropNameKey, fileName), 
+                (hpLabelPropNameKey, hpLabel), 
+                (mpLabelPropNameKey, mpLabel)])
+            return
+    
+    relationshipKey = str(relationshipKeys.next())
+
+    # MGI_Relationship
+    relRowBuffer.append(renderer.relationship(relationshipKey, objKey1, objKey2))
+
+    # MGI_Relationship_Property predicate, justification, filename, 
+    # hp term label, mp term label
+    propRowBuffer.append(renderer.properties(map(str, propertyKeys.take(5)), relationshipKey, record))
+
+    if len(relRowBuffer) >= rowBufferSize:
+        writeRows()
+
+# end processRecord() -------------------------------------
+
+def endProcess():
+    # Purpose: finish processing once every record has been seen
+    # Returns: 0
+    # Assumes: Nothing
+    # Effects: in delta and swap mode, adds relationships not in the input 
+    #	to deleteKeyList
+    # Throws: Nothing
+
+    if diffExisting:
+        # whatever is left was not in the input
+        for rKey, props in existingDict.values():
+            deleteKeyList.append(rKey)
+        print('%s: %s relationships to delete, %s property values to update' % (config.loadMode, len(deleteKeyList), len(updateList)))
+
+    return 0
+
+# end endProcess() -------------------------------------
+
 def process( ): 
     # Purpose: parses intermediate MP/HP Mapping file and creates bcp files
     # Returns: Nothing
@@ -257,126 +803,384 @@ def process( ):
     # Effects: sets global variables, writes to the file system
     # Throws: Nothing
 
-    global nextRelationshipKey, nextPropertyKey
-
     #
-    # Iterate through the load ready input file
+    # Stream through the load ready input file
     #
-    for line in fpInFile.readlines():
-        tokens = list(map(str.strip, str.split(line, TAB)))
-        mpId = tokens[0]
-        mpLabel =  tokens[1]
-        objKey1 = tokens[2]
-        hpId = tokens[3]
-        hpLabel = tokens[4]
-        objKey2 =  tokens[5]
-        predicate = tokens[6]
-        justification = tokens[7]
-        fileName = tokens[8]
-        
-        # MGI_Relationship
-        fpRelationshipFile.write('%s%s%s%s%s%s%s%s%s%s%s%s%s%s%s%s%s%s%s%s%s%s%s%s' % \
-            (nextRelationshipKey, TAB, catKey, TAB, objKey1, TAB, objKey2, TAB, relKey, TAB, qualKey, TAB, evidKey, TAB, refsKey, TAB, userKey, TAB, userKey, TAB, DATE, TAB, DATE, CRT))
+    for record in readRecords(fpInFile):
+        processRecord(record)
+
+    return endProcess()
+
+# end process() -------------------------------------
+
+def doDeletes():
+    # Purpose: delete this load's relationships, in delta mode only those
+    #	no longer in the input, and update changed property values
+    # Returns: 0
+    # Assumes: database connection
+    # Effects: deletes from/updates the database, records the doDeletes
+    #	stage in the checkpoint
+    # Throws: Nothing
+
+    global deleteCt
+
+    if isResumed('doDeletes'):
+        deleteCt = checkpoint.info('doDeletes')['rows']
+        return 0
+
+    if config.loadMode == 'delta':
+        rc = doDeltaUpdates()
+
+    # the deletes and updates are applied by swapStaged()
+    elif config.loadMode == 'swap':
+        rc = 0
+
+    elif config.deleteBatchSize > 0:
+        rc = doChunkedDeletes()
+
+    else:
+        # cascades to MGI_Relationship_Property; the copy engine commits
+        # the delete with its rows, see copyFiles()
+        db.sql('''delete from MGI_Relationship where _CreatedBy_key = %s ''' % userKey, None)
+        if not useCopy:
+            db.commit()
+        rc = 0
 
-        # MGI_Relationship_Property predicate
-        fpPropertyFile.write('%s%s%s%s%s%s%s%s%s%s%s%s%s%s%s%s%s%s' % (nextPropertyKey, TAB, nextRelationshipKey, TAB, predPropNameKey, TAB, predicate, TAB, predSeqNum, TAB, userKey, TAB, userKey, TAB, DATE, TAB, DATE, CRT ) )
+    if rc == 0:
+        completeStage('doDeletes', rows=deleteCt)
 
-        nextPropertyKey += 1
+    return rc
 
-        # MGI_Relationship_Property justification
-        fpPropertyFile.write('%s%s%s%s%s%s%s%s%s%s%s%s%s%s%s%s%s%s' % (nextPropertyKey, TAB, nextRelationshipKey, TAB, justPropNameKey, TAB, justification, TAB, justSeqNum, TAB, userKey, TAB, userKey, TAB, DATE, TAB, DATE, CRT ) )
+# end doDeletes() -------------------------------------
+
+def doChunkedDeletes():
+    # Purpose: delete this load's relationships DELETE_BATCH_SIZE at a time,
+    #	by key range, committing after each batch so the cascade to
+    #	MGI_Relationship_Property is never one long transaction
+    # Returns: 0
+    # Assumes: database connection
+    # Effects: deletes from the database, sets deleteCt
+    # Throws: Nothing
 
-        nextPropertyKey += 1
+    global deleteCt
 
-        # MGI_Relationship_Property predicate filename
-        fpPropertyFile.write('%s%s%s%s%s%s%s%s%s%s%s%s%s%s%s%s%s%s' % (nextPropertyKey, TAB, nextRelationshipKey, TAB, filePropNameKey, TAB, fileName, TAB, fileSeqNum, TAB, userKey, TAB, userKey, TAB, DATE, TAB, DATE, CRT ) )
+    # the first key of every batch, and the number of relationships
+    results = db.sql('''select _Relationship_key as startKey, total
+        from (select _Relationship_key,
+                row_number() over (order by _Relationship_key) as rn,
+                count(*) over () as total
+            from MGI_Relationship
+            where _CreatedBy_key = %s) r
+        where (rn - 1) %% %s = 0
+        order by startKey''' % (userKey, config.deleteBatchSize), 'auto')
 
-        nextPropertyKey += 1
+    if not results:
+        print('no relationships to delete')
+        return 0
+
+    total = results[0]['total']
+    startKeys = [r['startKey'] for r in results]
+    deleteCt = 0
+
+    for i, startKey in enumerate(startKeys):
+        # cascades to MGI_Relationship_Property
+        if i + 1 < len(startKeys):
+            db.sql('''delete from MGI_Relationship 
+                where _CreatedBy_key = %s 
+                and _Relationship_key >= %s and _Relationship_key < %s ''' % (userKey, startKey, startKeys[i + 1]), None)
+            deleteCt += config.deleteBatchSize
+        else:
+            db.sql('''delete from MGI_Relationship 
+                where _CreatedBy_key = %s 
+                and _Relationship_key >= %s ''' % (userKey, startKey), None)
+            deleteCt = total
+        db.commit()
+
+        print('deleted %s of %s relationships: %s' % (deleteCt, total, time.strftime("%H.%M.%S.%m.%d.%y", time.localtime(time.time()))))
 
-        # MGI_Relationship_Property hp term label
-        fpPropertyFile.write('%s%s%s%s%s%s%s%s%s%s%s%s%s%s%s%s%s%s' % (nextPropertyKey, TAB, nextRelationshipKey, TAB, hpLabelPropNameKey, TAB, hpLabel, TAB, hpLabelSeqNum, TAB, userKey, TAB, userKey, TAB, DATE, TAB, DATE, CRT ) )
+    return 0
 
-        nextPropertyKey += 1
+# end doChunkedDeletes() -------------------------------------
 
-        # MGI_Relationship_Property mp term label
-        fpPropertyFile.write('%s%s%s%s%s%s%s%s%s%s%s%s%s%s%s%s%s%s' % (nextPropertyKey, TAB, nextRelationshipKey, TAB, mpLabelPropNameKey, TAB, mpLabel, TAB, mpLabelSeqNum, TAB, userKey, TAB, userKey, TAB, DATE, TAB, DATE, CRT ) )
+def doDeltaUpdates():
+    # Purpose: delete the relationships in deleteKeyList and apply the
+    #	property values in updateList and commit
+    # Returns: 0
+    # Assumes: database connection
+    # Effects: deletes from/updates the database
+    # Throws: Nothing
 
-        nextPropertyKey += 1
+    applyDelta()
 
-        nextRelationshipKey += 1
+    # the copy engine commits them with its rows, see copyFiles()
+    if not useCopy:
+        db.commit()
 
     return 0
 
-# end process() -------------------------------------
+# end doDeltaUpdates() -------------------------------------
+
+def applyDelta():
+    # Purpose: delete the relationships in deleteKeyList and apply the
+    #	property values in updateList, deltaBatchSize per statement,
+    #	without committing
+    # Returns: Nothing
+    # Assumes: database connection
+    # Effects: deletes from/updates the database, sets deleteCt
+    # Throws: database errors
+
+    global deleteCt
 
-def doDeletes():
     # cascades to MGI_Relationship_Property
-    db.sql('''delete from MGI_Relationship where _CreatedBy_key = %s ''' % userKey, None)
-    db.commit()
+    deleteCt = len(deleteKeyList)
+    for i in range(0, len(deleteKeyList), deltaBatchSize):
+        keys = ','.join(map(str, deleteKeyList[i:i + deltaBatchSize]))
+        db.sql('''delete from MGI_Relationship where _Relationship_key in (%s) ''' % keys, None)
 
-    return 0
+    for i in range(0, len(updateList), deltaBatchSize):
+        values = ','.join(["(%s, '%s')" % (pKey, value.replace("'", "''")) for pKey, value in updateList[i:i + deltaBatchSize]])
+        db.sql('''update MGI_Relationship_Property p
+            set value = v.value, _ModifiedBy_key = %s, modification_date = now()
+            from (values %s) as v(_RelationshipProperty_key, value)
+            where p._RelationshipProperty_key = v._RelationshipProperty_key''' % (userKey, values), None)
 
-# end doDeletes() -------------------------------------
+# end applyDelta() -------------------------------------
 
 def bcpFiles():
-    if DEBUG  == 'true':
+    if config.debug:
         return 0
 
-    bcpCmd = '%s %s %s %s %s %s "\\t" "\\n" mgd' % (bcpin, server, database, relTable, outputDir, relBcpFile)
-    rc = os.system(bcpCmd)
+    if useCopy:
+        return copyFiles()
 
-    # update mgi_relationship_seq auto-sequence
-    db.sql(''' select setval('mgi_relationship_seq', (select max(_Relationship_key) from MGI_Relationship)) ''', None)
-    db.commit()
+    # the keys were reserved from the sequences, see KeyBlock, 
+    # so the sequences do not need to be updated
 
-    if rc != 0:
-        closeFiles()
-        print('Error bcping relationship file')
-        return 1 
+    relTarget, propTarget = relTable, propTable
+    if config.loadMode == 'swap':
+        relTarget, propTarget = relStageTable, propStageTable
 
-    bcpCmd = '%s %s %s %s %s %s "\\t" "\\n" mgd' % (bcpin, server, database, propTable, outputDir, propBcpFile)
-    rc = os.system(bcpCmd)
+    bcpin = '%s/bin/bcpin.csh' % config.pgDbUtils
 
-    # update mgi_relationship_property_seq auto-sequence
-    db.sql(''' select setval('mgi_relationship_property_seq', (select max(_RelationshipProperty_key) from MGI_Relationship_Property)) ''', None)
-    db.commit()
+    # each table is a stage of the checkpoint, a rerun after the property
+    # bcp failed only loads the property file
+    if not isResumed('loadRelationships'):
+        if config.loadMode == 'swap' and createStagingTables() != 0:
+            return 1
+
+        bcpCmd = '%s %s %s %s %s %s "\\t" "\\n" mgd' % (bcpin, config.server, config.database, relTarget, config.outputDir, config.relBcpFile)
+        rc = os.system(bcpCmd)
+
+        if rc != 0:
+            closeFiles()
+            print('Error bcping relationship file')
+            return 1 
+
+        completeStage('loadRelationships', rows=relationshipCt)
+
+    if not isResumed('loadProperties'):
+        bcpCmd = '%s %s %s %s %s %s "\\t" "\\n" mgd' % (bcpin, config.server, config.database, propTarget, config.outputDir, config.propBcpFile)
+        rc = os.system(bcpCmd)
+
+        if rc != 0:
+            db.useOneConnection(0)
+            closeFiles()
+            print('Error bcping property file')
+            return 1
+
+        completeStage('loadProperties', rows=propertyCt)
+
+    if config.loadMode == 'swap' and swapStaged() != 0:
+        db.useOneConnection(0)
+        return 1
+
+    db.useOneConnection(0)
+
+    return 0
+
+def copyFiles():
+    # Purpose: commit the rows streamed by the copy engine, in the same
+    #	transaction as the deletes and updates of doDeletes() (a full load
+    #	with DELETE_BATCH_SIZE commits each batch of deletes on its own)
+    # Returns: 0, 1 if the commit fails
+    # Assumes: closeFiles() has flushed the copy writers
+    # Effects: writes to the database
+    # Throws: Nothing
+
+    try:
+        db.commit()
+    except Exception as e:
+        print('Error committing copy: %s' % e)
+        return 1
+
+    print('copied %s relationships, %s properties' % (fpRelationshipFile.rowCount, fpPropertyFile.rowCount))
+
+    if config.loadMode == 'swap' and swapStaged() != 0:
+        db.useOneConnection(0)
+        return 1
 
     db.useOneConnection(0)
 
-    if rc != 0:
-        closeFiles()
-        print('Error bcping property file')
+    return 0
+
+# end copyFiles() -------------------------------------
+
+def createStagingTables():
+    # Purpose: (re)create the empty unlogged staging tables of swap mode
+    # Returns: 0, 1 if they cannot be created
+    # Assumes: database connection
+    # Effects: creates tables in the database
+    # Throws: Nothing
+
+    try:
+        dropStagingTables()
+        for stageTable, table in ((relStageTable, relTable), (propStageTable, propTable)):
+            db.sql('''create unlogged table mgd.%s (like mgd.%s including defaults)''' % (stageTable, table), None)
+        db.commit()
+    except Exception as e:
+        print('Error creating staging tables: %s' % e)
+        return 1
+
+    return 0
+
+# end createStagingTables() -------------------------------------
+
+def dropStagingTables():
+    # Purpose: drop the staging tables of swap mode
+    # Returns: Nothing
+    # Assumes: database connection
+    # Effects: drops tables in the database
+    # Throws: Nothing
+
+    for stageTable in (propStageTable, relStageTable):
+        db.sql('''drop table if exists mgd.%s''' % stageTable, None)
+    db.commit()
+
+# end dropStagingTables() -------------------------------------
+
+def swapStaged():
+    # Purpose: check the staged row counts against the rows written and
+    #	apply the changes to this load's relationships in one transaction:
+    #	the removed relationships are deleted, the changed property values
+    #	updated and the staged rows, the new relationships and the missing 
+    #	properties, inserted
+    # Returns: 0, 1 if the counts do not match, the load would leave no
+    #	relationships or the swap fails
+    # Assumes: database connection, the staging tables are loaded, 
+    #	deleteKeyList and updateList are set, see loadExisting()
+    # Effects: deletes from/updates/inserts into the database, drops the
+    #	staging tables once the changes are applied
+    # Throws: Nothing
+
+    relStaged = db.sql('''select count(*) as rowCt from mgd.%s''' % relStageTable, 'auto')[0]['rowCt']
+    propStaged = db.sql('''select count(*) as rowCt from mgd.%s''' % propStageTable, 'auto')[0]['rowCt']
+    print('staged %s of %s relationships, %s of %s properties' % (relStaged, relationshipCt, propStaged, propertyCt))
+
+    if relStaged != relationshipCt or propStaged != propertyCt:
+        print('Error: staged row counts do not match, the relationships were not replaced')
+        return 1
+
+    # an empty input would leave no mappings at all
+    if relStaged == 0 and len(deleteKeyList) >= existingCt:
+        print('Error: no relationships to load, the relationships were not replaced')
+        return 1
+
+    try:
+        applyDelta()
+        db.sql('''insert into mgd.%s select * from mgd.%s''' % (relTable, relStageTable), None)
+        db.sql('''insert into mgd.%s select * from mgd.%s''' % (propTable, propStageTable), None)
+        db.commit()
+    except Exception as e:
+        print('Error replacing relationships with the staged rows: %s' % e)
         return 1
+
+    print('applied staged relationships: %s' % time.strftime("%H.%M.%S.%m.%d.%y", time.localtime(time.time())))
+
+    dropStagingTables()
+
     return 0
 
+# end swapStaged() -------------------------------------
+
 #####################
 #
 # Main
 #
 #####################
 
-print('initialize: %s' % time.strftime("%H.%M.%S.%m.%d.%y", time.localtime(time.time())))
-if initialize() != 0:
-    exit(1, 'Error in  initialize \n' )
-
-print('process: %s' % time.strftime("%H.%M.%S.%m.%d.%y", time.localtime(time.time())))
-if process() != 0:
-    print('Error in the process method')
-    sys.exit(1)
-
-print('closeFiles: %s' % time.strftime("%H.%M.%S.%m.%d.%y", time.localtime(time.time())))
-if closeFiles() != 0:
-    print('Error closing files')
-    sys.exit(1)
-
-print('doDeletes: %s' % time.strftime("%H.%M.%S.%m.%d.%y", time.localtime(time.time())))
-if doDeletes() != 0:
-    print('Error doing deletes')
-    sys.exit(1)
-
-print('bcpFiles: %s' % time.strftime("%H.%M.%S.%m.%d.%y", time.localtime(time.time())))
-if bcpFiles()  != 0:
-    print('Error executing bcp')
-    sys.exit(1)
+def main():
+    # Purpose: run the load from the intermediate file
+    # Returns: Nothing
+    # Assumes: Nothing
+    # Effects: exits with 0 on success, 1 on error
+    # Throws: Nothing
 
-sys.exit(0)
+    global metrics
+
+    loadConfig = loadconfig.LoadConfig()
+    metrics = loadmetrics.LoadMetrics('process', loadConfig)
+
+    with metrics.stage('initialize'):
+        if initialize(loadConfig=loadConfig) != 0:
+            print('Error in initialize')
+            sys.exit(1)
+
+    # the bcp files of an interrupted load are loaded as they are
+    if not isResumed('render'):
+        if diffExisting:
+            with metrics.stage('loadExisting') as stage:
+                if loadExisting() != 0:
+                    print('Error loading existing relationships')
+                    sys.exit(1)
+                stage.rows = len(existingDict)
+
+        with metrics.stage('reserveKeys'):
+            if reserveKeys() != 0:
+                print('Error reserving keys')
+                sys.exit(1)
+
+        if deleteFirst:
+            with metrics.stage('doDeletes') as stage:
+                if doDeletes() != 0:
+                    print('Error doing deletes')
+                    sys.exit(1)
+                stage.rows = deleteCt
+
+        with metrics.stage('process') as stage:
+            if process() != 0:
+                print('Error in the process method')
+                sys.exit(1)
+            stage.rows = relationshipCt + len(relRowBuffer)
+
+        with metrics.stage('closeFiles'):
+            if closeFiles() != 0:
+                print('Error closing files')
+                sys.exit(1)
+            completeRender()
+
+    if not deleteFirst:
+        with metrics.stage('doDeletes') as stage:
+            if doDeletes() != 0:
+                print('Error doing deletes')
+                sys.exit(1)
+            stage.rows = deleteCt
+
+    with metrics.stage('bcpFiles') as stage:
+        if bcpFiles()  != 0:
+            print('Error executing bcp')
+            sys.exit(1)
+        if not config.debug:
+            stage.rows = relationshipCt
+
+    # the load is complete, a rerun starts over
+    if config.resumeLoad:
+        loadcheckpoint.discard(config.checkpointFile)
+
+    metrics.write()
+
+    sys.exit(0)
+
+# end main() -------------------------------------
+
+if __name__ == '__main__':
+    main()